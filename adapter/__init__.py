@@ -1,3 +0,0 @@
-from .sql_price_repository import *  # NOQA
-from .http_price_sourcing_repository import *  # NOQA
-from .price_tg_repository import *  # NOQA
\ No newline at end of file
@@ -0,0 +1,247 @@
+import asyncio
+import contextlib
+import copy
+import dataclasses
+import decimal
+import enum
+import statistics
+import time
+from typing import Mapping, Sequence, TYPE_CHECKING
+
+from domain.price_sourcing_repository import CryptoPriceSourcingRepository
+from settings import settings
+from utils.enums import CaseInsensitiveMixin
+from utils.logging import log
+from utils.metrics import metrics
+from utils.singletone import ModuleSingletonAssigner
+from utils.weakref import Finalizable
+
+if TYPE_CHECKING:
+    from domain.price import CryptoPrice
+
+__all__ = (
+    'PriceAggregation',
+    'SourceStats',
+    'CompositeCryptoPriceSourcingRepository',
+)
+
+SOURCE_REQUESTS = metrics.counter('price_source_requests_total', 'Запросы к источникам цен: ok/error/cancelled.')
+SOURCE_SECONDS = metrics.histogram('price_source_seconds', 'Время ответа источника цен.')
+SOURCE_LATENCY = metrics.gauge('price_source_latency_ewma_seconds', 'Скользящая средняя задержки источника цен.')
+SOURCE_ERROR_RATE = metrics.gauge('price_source_error_rate_ewma', 'Скользящая доля ошибок источника цен.')
+HEDGED_REQUESTS = metrics.counter('price_source_hedged_total', 'Запросы к следующему источнику по таймауту или ошибке.')
+
+# Результат одного источника: цены по позициям пачки, None - источник монету не знает.
+SourceResult = list[decimal.Decimal | None]
+
+
+class PriceAggregation(CaseInsensitiveMixin, enum.StrEnum):
+    # Первый ответ; монеты, которых в нем нет, добираются из ответов остальных запущенных источников.
+    FIRST = 'first'
+    # Медиана по ответам quorum источников - защита от одного источника с выбросом.
+    MEDIAN = 'median'
+
+
+@dataclasses.dataclass
+class SourceStats:
+    """
+    Скользящие средние задержки успешных ответов и доли ошибок источника.
+    Проигравшие гонку и отмененные запросы не учитываются - их задержка неизвестна.
+    """
+    alpha: float
+    latency: float | None = None
+    error_rate: float = 0.0
+    requests: int = 0
+    errors: int = 0
+
+    def on_success(self, elapsed: float) -> None:
+        self.requests += 1
+        self.latency = elapsed if self.latency is None else self.alpha * elapsed + (1 - self.alpha) * self.latency
+        self.error_rate *= 1 - self.alpha
+
+    def on_error(self) -> None:
+        self.requests += 1
+        self.errors += 1
+        self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+
+    @property
+    def healthy(self) -> bool:
+        return self.error_rate <= settings.price_source_max_error_rate
+
+
+class CompositeCryptoPriceSourcingRepository(Finalizable, CryptoPriceSourcingRepository):
+    """
+    Цены из нескольких источников за одним интерфейсом.
+
+    Источники опрашиваются по рейтингу: сначала здоровые, среди них - с меньшей задержкой;
+    источник без замеров стоит на своем месте из конфигурации. В режиме first запрос уходит
+    лучшему источнику, и если за hedge_delay он не ответил или упал, параллельно запускается
+    следующий (hedged request); берется первый успешный ответ, остальные запросы отменяются,
+    как только все монеты пачки получили цену. В режиме median запросы уходят всем источникам
+    сразу, и цена - медиана ответов первых quorum источников.
+
+    Каждый источник работает со своими копиями таргетов, поэтому гонка не портит current
+    в исходной пачке: итоговые цены проставляются один раз, после агрегации.
+    """
+    def __init__(
+            self,
+            sources: Mapping[str, CryptoPriceSourcingRepository],
+            aggregation: str = settings.price_aggregation,
+            hedge_delay: float = settings.price_hedge_delay.total_seconds(),
+            quorum: int = settings.price_median_quorum,
+    ) -> None:
+        if not sources:
+            raise ValueError('At least one price source is required.')
+        self.sources = dict(sources)
+        self.aggregation = PriceAggregation(aggregation)
+        self.hedge_delay = hedge_delay
+        self.quorum = max(1, min(quorum, len(self.sources)))
+        self.stats = {name: SourceStats(alpha=settings.price_source_ewma_alpha) for name in self.sources}
+
+    def ranked(self) -> list[str]:
+        order = {name: position for position, name in enumerate(self.sources)}
+        return sorted(
+            self.sources,
+            key=lambda name: (
+                not self.stats[name].healthy,
+                self.stats[name].latency is None,
+                self.stats[name].latency or 0.0,
+                order[name],
+            ),
+        )
+
+    async def fetch(self, price: 'CryptoPrice') -> 'CryptoPrice':
+        await self.fetch_many([price])
+        return price
+
+    async def fetch_many(self, prices: Sequence['CryptoPrice']) -> Sequence['CryptoPrice']:
+        if not prices:
+            return prices
+        results = await self._gather(prices)
+        for position, price in enumerate(prices):
+            values = [result[position] for result in results if result[position] is not None]
+            if not values:
+                price.current = None
+            elif self.aggregation is PriceAggregation.MEDIAN:
+                price.current = statistics.median(values)
+            else:
+                price.current = values[0]
+        return prices
+
+    async def _query(self, name: str, prices: Sequence['CryptoPrice']) -> SourceResult:
+        copies = [copy.copy(price) for price in prices]
+        for price in copies:
+            price.current = None
+        started = time.perf_counter()
+        try:
+            await self.sources[name].fetch_many(copies)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                SOURCE_REQUESTS.inc(source=name, result='cancelled')
+            else:
+                # Отмену изнутри источника, а не от _gather, считаем его ошибкой.
+                self._on_error(name)
+            raise
+        except Exception:
+            self._on_error(name)
+            raise
+        elapsed = time.perf_counter() - started
+        self.stats[name].on_success(elapsed)
+        SOURCE_REQUESTS.inc(source=name, result='ok')
+        SOURCE_SECONDS.observe(elapsed, source=name)
+        SOURCE_LATENCY.set(self.stats[name].latency, source=name)
+        SOURCE_ERROR_RATE.set(self.stats[name].error_rate, source=name)
+        return [price.current for price in copies]
+
+    def _on_error(self, name: str) -> None:
+        self.stats[name].on_error()
+        SOURCE_REQUESTS.inc(source=name, result='error')
+        SOURCE_ERROR_RATE.set(self.stats[name].error_rate, source=name)
+
+    def _done(self, results: list[SourceResult], size: int) -> bool:
+        if self.aggregation is PriceAggregation.MEDIAN:
+            return len(results) >= self.quorum
+        return any(results) and all(
+            any(result[position] is not None for result in results) for position in range(size)
+        )
+
+    async def _gather(self, prices: Sequence['CryptoPrice']) -> list[SourceResult]:
+        """
+        Ответы источников в порядке их прихода. Заканчивается, когда ответов достаточно
+        для агрегации или когда все источники ответили или упали.
+        """
+        queue = self.ranked()
+        running: dict[asyncio.Task, str] = {}
+        results: list[SourceResult] = []
+
+        def launch() -> None:
+            name = queue.pop(0)
+            running[asyncio.create_task(self._query(name, prices), name=f'price-source-{name}')] = name
+
+        launch()
+        if self.aggregation is PriceAggregation.MEDIAN:
+            while queue:
+                launch()
+        try:
+            while running:
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=self.hedge_delay if queue else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    HEDGED_REQUESTS.inc(reason='timeout')
+                    await log.adebug(f'Price sources {list(running.values())} are slow, hedging.', next=queue[0])
+                    launch()
+                    continue
+                for task in done:
+                    name = running.pop(task)
+                    # Задачи источников отменяет только finally ниже, поэтому отмененная здесь задача -
+                    # отмена, пришедшая из самого источника. Наружу ее не пропускаем: это ошибка источника.
+                    if task.cancelled():
+                        exc = asyncio.CancelledError(f'Price source {name} was cancelled from inside.')
+                    else:
+                        exc = task.exception()
+                    if exc is not None:
+                        await log.awarning(f'Price source {name} failed.', error=repr(exc))
+                        if queue:
+                            HEDGED_REQUESTS.inc(reason='error')
+                            launch()
+                    else:
+                        results.append(task.result())
+                if self._done(results, len(prices)):
+                    break
+                if not running and queue:
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+        if not results:
+            await log.aerror(f'All price sources failed for {len(prices)} prices.')
+        return results
+
+    async def _finalize(self) -> None:
+        for source in self.sources.values():
+            if isinstance(source, Finalizable):
+                with contextlib.suppress(Exception):
+                    await source.finalize()
+
+    def __call__(self, *args, **kwargs) -> 'CompositeCryptoPriceSourcingRepository':
+        return self
+
+
+def _build_repository() -> CompositeCryptoPriceSourcingRepository:
+    from adapter.price_source import PriceSource, build_price_source
+    return CompositeCryptoPriceSourcingRepository(
+        sources={
+            PriceSource(name).value: build_price_source(name)
+            for name in settings.price_sources
+            if PriceSource(name) is not PriceSource.COMPOSITE
+        },
+    )
+
+
+repository: CompositeCryptoPriceSourcingRepository
+ModuleSingletonAssigner(_build_repository, 'repository').assign()
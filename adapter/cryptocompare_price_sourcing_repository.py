@@ -0,0 +1,120 @@
+import asyncio
+import contextlib
+import decimal
+from typing import Dict, Iterator, Sequence, TYPE_CHECKING
+
+from pydantic import RootModel, ValidationError
+
+from domain.price_sourcing_repository import CryptoPriceSourcingRepository
+from settings import settings
+from utils.logging import log
+from utils.metrics import metrics
+from utils.singletone import ModuleSingletonAssigner
+from utils.weakref import Finalizable
+
+if TYPE_CHECKING:
+    import httpx
+
+    from domain.price import CryptoPrice
+
+__all__ = (
+    'CryptoCompareUpstreamError',
+    'CryptoComparePriceSourcingRepository',
+)
+
+# Ограничение api на длину параметра fsyms.
+FSYMS_MAX_LENGTH = 300
+
+CRYPTOCOMPARE_RESPONSES = metrics.counter('cryptocompare_responses_total', 'Ответы CryptoCompare по статусам.')
+
+
+class CryptoCompareUpstreamError(RuntimeError):
+    """
+    CryptoCompare отвечает на ошибки статусом 200 и телом {"Response": "Error", "Message": ...}.
+    """
+
+
+class PricesResponse(RootModel[Dict[str, Dict[str, decimal.Decimal]]]):
+    pass
+
+
+class CryptoComparePriceSourcingRepository(Finalizable, CryptoPriceSourcingRepository):
+    """
+    Второй источник цен: min-api.cryptocompare.com/data/pricemulti. Монеты адресуются тикером,
+    а не standard_name CoinGecko, поэтому одна пачка - один запрос на все уникальные тикеры.
+    """
+    def __init__(self, base_url: str = settings.cryptocompare_url, api_key: str | None = settings.cryptocompare_api_key) -> None:
+        self.base_url = base_url
+        self.api_key = api_key
+        self._client: 'httpx.AsyncClient | None' = None
+
+    @property
+    def client(self) -> 'httpx.AsyncClient':
+        # Как и у HTTPCryptoPriceSourcingRepository: httpx импортируется при первом запросе.
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=settings.api_max_connections),
+                transport=httpx.AsyncHTTPTransport(retries=settings.api_transport_retries),
+                headers={'authorization': f'Apikey {self.api_key}'} if self.api_key else None,
+            )
+        return self._client
+
+    @client.setter
+    def client(self, client: 'httpx.AsyncClient') -> None:
+        self._client = client
+
+    async def fetch(self, price: 'CryptoPrice') -> 'CryptoPrice':
+        await self.fetch_many([price])
+        return price
+
+    async def fetch_many(self, prices: Sequence['CryptoPrice']) -> Sequence['CryptoPrice']:
+        # Пачки тикеров независимы, запрашиваем их одновременно.
+        chunks = self._chunk_symbols({price.ticker.upper() for price in prices})
+        fetched: dict[str, decimal.Decimal] = {}
+        for chunk_prices in await asyncio.gather(*map(self._request_chunk, chunks)):
+            fetched.update(chunk_prices)
+        for price in prices:
+            price.current = fetched.get(price.ticker.upper())
+        if missing := {price.ticker for price in prices if price.current is None}:
+            await log.awarning(f'No CryptoCompare prices for {sorted(missing)}')
+        return prices
+
+    async def _request_chunk(self, chunk: list[str]) -> dict[str, decimal.Decimal]:
+        currency = settings.vs_currency.upper()
+        response = await self.client.get(self.base_url, params={'fsyms': ','.join(chunk), 'tsyms': currency})
+        CRYPTOCOMPARE_RESPONSES.inc(status=response.status_code)
+        response.raise_for_status()
+        try:
+            validated = PricesResponse.model_validate_json(response.content)
+        except ValidationError:
+            payload = response.json()
+            if payload.get('Response') == 'Error':
+                raise CryptoCompareUpstreamError(payload.get('Message'))
+            raise
+        return {symbol: info[currency] for symbol, info in validated.root.items() if currency in info}
+
+    @staticmethod
+    def _chunk_symbols(symbols: set[str]) -> Iterator[list[str]]:
+        chunk, length = [], 0
+        for symbol in sorted(symbols):
+            if chunk and length + len(symbol) + 1 > FSYMS_MAX_LENGTH:
+                yield chunk
+                chunk, length = [], 0
+            chunk.append(symbol)
+            length += len(symbol) + 1
+        if chunk:
+            yield chunk
+
+    async def _finalize(self) -> None:
+        if self._client is not None:
+            with contextlib.suppress(Exception):
+                await self._client.aclose()
+
+    def __call__(self, *args, **kwargs) -> 'CryptoComparePriceSourcingRepository':
+        return self
+
+
+repository: CryptoComparePriceSourcingRepository
+ModuleSingletonAssigner(CryptoComparePriceSourcingRepository, 'repository').assign()
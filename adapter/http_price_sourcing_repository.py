@@ -1,21 +1,47 @@
+import asyncio
+import collections
 import contextlib
+import datetime
 import decimal
+import time
 from http import HTTPStatus
-from typing import Dict
+from typing import Dict, Iterable, Iterator, Sequence, TYPE_CHECKING
+from urllib.parse import quote
 
-import httpx
 from pydantic import RootModel
 
+from adapter.price_cache_repository import build_price_cache
+from domain.price_cache_repository import ChunkValidators
 from domain.price_sourcing_repository import CryptoPriceSourcingRepository
 from settings import settings
 from utils.logging import log
+from utils.metrics import metrics
+from utils.rate_limiter import AdaptiveRateLimiter
 from utils.singletone import ModuleSingletonAssigner
 from utils.weakref import Finalizable
 
+if TYPE_CHECKING:
+    import httpx
+
+    from domain.price import CryptoPrice
+    from domain.price_cache_repository import PriceCacheRepository
+
 __all__ = (
     'repository',
 )
 
+HTTP_RESPONSES = metrics.counter('http_responses_total', 'Ответы api цен по статусам.')
+HTTP_REQUEST_SECONDS = metrics.histogram('http_request_seconds', 'Время запроса к api цен.')
+CACHE_LOOKUPS = metrics.counter('price_cache_lookups_total', 'Обращения к кэшу цен: hit/miss.')
+CACHE_HIT_RATIO = metrics.gauge('price_cache_hit_ratio', 'Доля попаданий в кэш цен с начала работы процесса.')
+HTTP_RESPONSE_BYTES = metrics.counter('http_response_bytes_total', 'Байты тел ответов api цен по сети, по content-encoding.')
+# Распаковку gzip делает httpx при чтении тела внутри client.get, ее здесь нет.
+HTTP_VALIDATE_SECONDS = metrics.histogram(
+    'http_validate_cpu_seconds', 'CPU время валидации уже распакованного тела ответа api цен.',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5),
+)
+HTTP_CONDITIONAL = metrics.counter('http_conditional_total', 'Условные запросы к api цен: not_modified/modified.')
+
 
 class PriceInfo(RootModel[Dict[str, decimal.Decimal]]):
     pass
@@ -25,47 +51,267 @@ class PricesResponse(RootModel[Dict[str, PriceInfo]]):
     pass
 
 
+def cache_directives(headers: 'httpx.Headers') -> dict[str, str]:
+    return {
+        key.strip().lower(): value.strip()
+        for key, _, value in (directive.partition('=') for directive in headers.get('cache-control', '').split(','))
+    }
+
+
+def cache_ttl(headers: 'httpx.Headers') -> datetime.timedelta | None:
+    """
+    Сколько держать цены ответа в кэше: max-age за вычетом Age, но не дольше нашего price_cache_ttl;
+    0 - не кэшировать (no-store, no-cache или ответ уже устарел), None - max-age нет, TTL кэша по умолчанию.
+    """
+    directives = cache_directives(headers)
+    if 'no-store' in directives or 'no-cache' in directives:
+        return datetime.timedelta(0)
+    try:
+        max_age = int(directives['max-age']) - int(headers.get('age', 0))
+    except (KeyError, ValueError):
+        return None
+    return max(datetime.timedelta(0), min(datetime.timedelta(seconds=max_age), settings.price_cache_ttl))
+
+
 class HTTPCryptoPriceSourcingRepository(Finalizable, CryptoPriceSourcingRepository):
-    def __init__(self, base_url: str = settings.api_base_url) -> None:
+    def __init__(
+            self,
+            base_url: str = settings.api_base_url,
+            cache: 'PriceCacheRepository | None' = None,
+    ) -> None:
         self.base_url = base_url
-        self.client = httpx.AsyncClient(
-            http2=True,
-            limits=httpx.Limits(max_connections=10),
-            transport=httpx.AsyncHTTPTransport(retries=2),
+        self._client: 'httpx.AsyncClient | None' = None
+        # Один лимитер на все fetch консьюмеры.
+        self.rate_limiter = AdaptiveRateLimiter(
+            rate=settings.api_rate_limit,
+            burst=settings.api_rate_burst,
+            min_rate=settings.api_rate_limit_min,
+            max_rate=settings.api_rate_limit_max,
+            step=settings.api_rate_limit_step,
+            backoff_base=settings.api_backoff_base,
+            backoff_max=settings.api_backoff_max,
         )
-        self._price_cache = {}
+        self.cache = cache if cache is not None else build_price_cache()
+        # In-flight монеты: задача запроса и future с ценой.
+        self._in_flight: dict[str, tuple[asyncio.Task, asyncio.Future[decimal.Decimal | None]]] = {}
+        # Задачи запросов и сколько вызовов их ждут. Заодно держит ссылки, чтобы задачи не собрал gc.
+        self._fetch_tasks: dict[asyncio.Task, int] = {}
+
+    @property
+    def client(self) -> 'httpx.AsyncClient':
+        """
+        Клиент создается при первом запросе: httpx и h2 не нужны запуску, которому хватило кэша,
+        и не входят во время старта.
+        """
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=settings.api_max_connections),
+                transport=httpx.AsyncHTTPTransport(retries=settings.api_transport_retries),
+            )
+        return self._client
+
+    @client.setter
+    def client(self, client: 'httpx.AsyncClient') -> None:
+        self._client = client
+
+    async def fetch(self, price: 'CryptoPrice') -> 'CryptoPrice':
+        await self.fetch_many([price])
+        return price
+
+    async def fetch_many(self, prices: Sequence['CryptoPrice']) -> Sequence['CryptoPrice']:
+        current_prices = await self._fetch_names(dict.fromkeys(price.standard_name for price in prices))
+        for price in prices:
+            with contextlib.suppress(KeyError):
+                price.current = current_prices[price.standard_name]
+        return prices
 
-    async def fetch(self, price):
+    async def _fetch_names(self, names: Iterable[str]) -> dict[str, decimal.Decimal]:
+        """
+        Single-flight: первый промах кэша по монете создает future и запускает запрос отдельной задачей,
+        все конкурентные вызовы по этой монете, включая создавший, ждут тот же future - с результатом,
+        с пустым результатом при 429 или с тем же исключением. Отмена вызова, создавшего future,
+        не отменяет запрос, который ждут остальные; запрос, который больше никто не ждет, отменяется.
+        """
+        names = list(names)
+        current_prices = await self.cache.get_many(names)
+        CACHE_LOOKUPS.inc(len(current_prices), result='hit')
+        CACHE_LOOKUPS.inc(len(names) - len(current_prices), result='miss')
+        CACHE_HIT_RATIO.set(self.cache.stats.hit_ratio)
+        if current_prices:
+            await log.adebug(f'Got {len(current_prices)} prices from cache.', names=list(current_prices))
+
+        missing = [name for name in names if name not in current_prices]
+        waiting = {name: self._in_flight[name] for name in missing if name in self._in_flight}
+        if waiting:
+            await log.adebug(f'Waiting for {len(waiting)} in-flight prices.', names=list(waiting))
+        loop = asyncio.get_running_loop()
+        # При любом промахе запрашиваем все монеты вызова, кроме уже запрошенных, а не только промахи:
+        # вызывающий передает стабильную пачку, и ее url и ключ валидаторов повторяются от запуска к запуску.
+        requested = names if missing else ()
+        if owned := {name: loop.create_future() for name in requested if name not in self._in_flight}:
+            task = asyncio.create_task(self._fetch_owned(owned), name='price-fetch')
+            self._fetch_tasks[task] = 0
+            task.add_done_callback(self._fetch_tasks.pop)
+            waiting.update((name, (task, future)) for name, future in owned.items())
+            self._in_flight.update((name, (task, future)) for name, future in owned.items())
+
+        tasks = {task for task, _ in waiting.values()}
+        for task in tasks:
+            self._fetch_tasks[task] += 1
+        orphaned = []
+        try:
+            for name, (_, future) in waiting.items():
+                try:
+                    # shield, чтобы отмена ждущего не отменила общий future.
+                    current_price = await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    if not future.cancelled() or asyncio.current_task().cancelling():
+                        raise
+                    # Отменили сам запрос, а не этот вызов: монету запрашиваем заново.
+                    orphaned.append(name)
+                    continue
+                if current_price is not None:
+                    current_prices[name] = current_price
+        finally:
+            for task in tasks:
+                if task.done():
+                    continue
+                self._fetch_tasks[task] -= 1
+                if not self._fetch_tasks[task]:
+                    # Оставшиеся пачки запроса больше никому не нужны.
+                    task.cancel()
+        if orphaned:
+            current_prices.update(await self._fetch_names(orphaned))
+        return current_prices
+
+    async def _fetch_owned(self, owned: dict[str, asyncio.Future[decimal.Decimal | None]]) -> None:
         try:
-            current_price = self._price_cache[price.standard_name]
-        except KeyError:
+            # Пачки, получившие 429, уходят в конец очереди повторов и ждут, пока лимитер их пропустит.
+            retry_queue = collections.deque((chunk, 0) for chunk in self._chunk_names(sorted(owned)))
+            while retry_queue:
+                chunk, attempt = retry_queue.popleft()
+                fetched = await self._request_chunk(chunk, attempt)
+                if fetched is None:
+                    if attempt + 1 < settings.api_max_attempts:
+                        retry_queue.append((chunk, attempt + 1))
+                        continue
+                    await log.awarning(f'Prices {chunk} got 429 {attempt + 1} times, giving up until next run.')
+                    fetched = {}
+                for name in chunk:
+                    owned[name].set_result(fetched.get(name))
+        except Exception as exc:
+            for future in owned.values():
+                if not future.done():
+                    future.set_exception(exc)
+                    # Помечаем исключение как полученное, даже если ждущих нет.
+                    future.exception()
+            # Исключение получат ждущие future, у задачи его никто не заберет.
+        finally:
+            # Сюда доходит и отмена самой задачи (_finalize): ждущие увидят отмененный future и повторят запрос.
+            for name, future in owned.items():
+                future.cancel()
+                del self._in_flight[name]
+
+    def _chunk_names(self, names: Iterable[str]) -> Iterator[list[str]]:
+        """
+        Бьет названия на чанки так, чтобы в одном запросе было не больше settings.api_ids_per_request
+        идентификаторов и URL не превышал settings.api_max_url_length.
+        """
+        budget = settings.api_max_url_length - len(self.base_url) - len(
+            f'?ids=&vs_currencies={settings.vs_currency}'
+        )
+        separator_len = len(quote(','))
+        chunk, chunk_len = [], 0
+        for name in names:
+            name_len = len(quote(name)) + separator_len
+            if chunk and (len(chunk) >= settings.api_ids_per_request or chunk_len + name_len > budget):
+                yield chunk
+                chunk, chunk_len = [], 0
+            chunk.append(name)
+            chunk_len += name_len
+        if chunk:
+            yield chunk
+
+    async def _request_chunk(self, chunk: list[str], attempt: int = 0) -> dict[str, decimal.Decimal] | None:
+        """
+        Возвращает None, если api ответил 429 и пачку нужно повторить.
+
+        Запрос условный, если по этой пачке уже есть ETag/Last-Modified: на 304 цены берутся
+        из прошлого ответа без скачивания и разбора тела. Тело валидируется прямо из байтов,
+        без промежуточных python объектов. Полученные цены пишутся в кэш с TTL из Cache-Control,
+        если сервер разрешает их кэшировать.
+        """
+        # Валидаторы по составу пачки. Пачки стабильны между запусками, потому что названия сортируются.
+        key = ','.join(chunk)
+        validators = await self.cache.get_validators(key)
+        await self.rate_limiter.acquire()
+        with HTTP_REQUEST_SECONDS.time():
             response = await self.client.get(
-                    self.base_url,
-                    params={'ids': price.standard_name, 'vs_currencies': settings.vs_currency},
-                )
-            if response.status_code == HTTPStatus.OK:
-                validated = PricesResponse.model_validate(response.json())
-                current_price = validated.root[price.standard_name].root[settings.vs_currency]
-                price.current = current_price
-                self._price_cache[price.standard_name] = price.current
-            elif response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
-                await log.awarning(f'Price "{price}" http fetch. Got 429, skipping...')
-                return price
+                self.base_url,
+                params={'ids': ','.join(chunk), 'vs_currencies': settings.vs_currency},
+                headers=validators.headers if validators is not None else None,
+            )
+        HTTP_RESPONSES.inc(status=response.status_code)
+        HTTP_RESPONSE_BYTES.inc(
+            response.num_bytes_downloaded,
+            encoding=response.headers.get('content-encoding', 'identity'),
+        )
+        if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+            delay = self.rate_limiter.on_rate_limited(response.headers, attempt)
+            await log.awarning(
+                f'Prices {chunk} http fetch. Got 429, retrying in {delay:.1f}s.',
+                attempt=attempt,
+                rate=self.rate_limiter.rate,
+            )
+            return None
 
-            response.raise_for_status()
+        if response.status_code == HTTPStatus.NOT_MODIFIED and validators is not None:
+            self.rate_limiter.on_success(response.headers)
+            HTTP_CONDITIONAL.inc(result='not_modified')
+            fetched = dict(validators.prices)
         else:
-            await log.ainfo(f'Got price "{price}" from cache. Current price is {current_price}')
-            price.current = current_price
+            response.raise_for_status()
+            self.rate_limiter.on_success(response.headers)
+            if validators is not None:
+                HTTP_CONDITIONAL.inc(result='modified')
+            started = time.process_time()
+            validated = PricesResponse.model_validate_json(response.content)
+            HTTP_VALIDATE_SECONDS.observe(time.process_time() - started)
+            fetched = {
+                name: info.root[settings.vs_currency]
+                for name, info in validated.root.items()
+                if settings.vs_currency in info.root
+            }
+            await self.cache.set_validators(key, self._validators(response.headers, fetched))
+        if missing := set(chunk).difference(fetched):
+            await log.awarning(f'No prices in response for {sorted(missing)}')
+        if (ttl := cache_ttl(response.headers)) is None or ttl:
+            await self.cache.set_many(fetched, ttl=ttl)
+        return fetched
 
-        return price
+    @staticmethod
+    def _validators(headers: 'httpx.Headers', fetched: dict[str, decimal.Decimal]) -> ChunkValidators | None:
+        etag, last_modified = headers.get('etag'), headers.get('last-modified')
+        if (etag is None and last_modified is None) or 'no-store' in cache_directives(headers):
+            return None
+        return ChunkValidators(etag, last_modified, fetched)
 
     async def _finalize(self) -> None:
-        with contextlib.suppress(Exception):
-            await self.client.aclose()
+        tasks = list(self._fetch_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._client is not None:
+            with contextlib.suppress(Exception):
+                await self._client.aclose()
+        if isinstance(self.cache, Finalizable):
+            await self.cache.finalize()
 
     def __call__(self, *args, **kwargs) -> 'HTTPCryptoPriceSourcingRepository':
         return self
 
 
 repository: HTTPCryptoPriceSourcingRepository
-ModuleSingletonAssigner(HTTPCryptoPriceSourcingRepository, 'repository').assign()
\ No newline at end of file
+ModuleSingletonAssigner(HTTPCryptoPriceSourcingRepository, 'repository').assign()
@@ -0,0 +1,266 @@
+import collections
+import contextlib
+import dataclasses
+import datetime
+import decimal
+import enum
+import json
+import time
+from typing import AsyncIterator, Iterable, Mapping, TYPE_CHECKING
+
+from domain.price_cache_repository import ChunkValidators, PriceCacheRepository, PriceCacheStats
+from settings import settings
+from utils.enums import CaseInsensitiveMixin
+from utils.logging import log
+from utils.weakref import Finalizable
+
+if TYPE_CHECKING:
+    import aiosqlite
+
+__all__ = (
+    'PriceCacheBackend',
+    'MemoryPriceCacheRepository',
+    'SQLitePriceCacheRepository',
+    'build_price_cache',
+)
+
+# Ограничение на количество параметров в одном IN (...) запросе.
+SQLITE_IN_CHUNK = 500
+
+
+class PriceCacheBackend(CaseInsensitiveMixin, enum.StrEnum):
+    MEMORY = 'memory'
+    SQLITE = 'sqlite'
+
+
+class MemoryPriceCacheRepository(Finalizable, PriceCacheRepository):
+    """
+    Кэш в памяти процесса. Живет только в рамках одного запуска.
+    """
+    def __init__(
+            self,
+            maxsize: int = settings.price_cache_maxsize,
+            ttl: datetime.timedelta = settings.price_cache_ttl,
+            validators_maxsize: int = settings.api_validators_maxsize,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.validators_maxsize = validators_maxsize
+        self.stats = PriceCacheStats()
+        self._entries: collections.OrderedDict[str, tuple[decimal.Decimal, float]] = collections.OrderedDict()
+        self._validators: collections.OrderedDict[str, ChunkValidators] = collections.OrderedDict()
+
+    async def get_many(self, names: Iterable[str]) -> dict[str, decimal.Decimal]:
+        now = time.time()
+        found = {}
+        for name in names:
+            try:
+                price, expires_at = self._entries[name]
+            except KeyError:
+                self.stats.misses += 1
+                continue
+            if expires_at <= now:
+                del self._entries[name]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                continue
+            self._entries.move_to_end(name)
+            self.stats.hits += 1
+            found[name] = price
+        return found
+
+    async def set_many(
+            self,
+            prices: Mapping[str, decimal.Decimal],
+            ttl: datetime.timedelta | None = None,
+    ) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl).total_seconds()
+        for name, price in prices.items():
+            self._entries[name] = (price, expires_at)
+            self._entries.move_to_end(name)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    async def get_validators(self, key: str) -> ChunkValidators | None:
+        if (validators := self._validators.get(key)) is not None:
+            self._validators.move_to_end(key)
+        return validators
+
+    async def set_validators(self, key: str, validators: ChunkValidators | None) -> None:
+        if validators is None:
+            self._validators.pop(key, None)
+            return
+        self._validators[key] = validators
+        self._validators.move_to_end(key)
+        while len(self._validators) > self.validators_maxsize:
+            self._validators.popitem(last=False)
+
+    async def _finalize(self) -> None:
+        log.info('Price cache stats.', hit_ratio=self.stats.hit_ratio, **dataclasses.asdict(self.stats))
+
+
+class SQLitePriceCacheRepository(Finalizable, PriceCacheRepository):
+    """
+    Кэш в отдельном SQLite файле. Переживает перезапуски процесса, поэтому запуски по таймеру,
+    которые случаются чаще чем TTL, обходятся без сети, а после TTL - условными запросами
+    с валидаторами прошлого запуска.
+    """
+    def __init__(
+            self,
+            path: str = settings.price_cache_path,
+            maxsize: int = settings.price_cache_maxsize,
+            ttl: datetime.timedelta = settings.price_cache_ttl,
+            validators_maxsize: int = settings.api_validators_maxsize,
+    ) -> None:
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.validators_maxsize = validators_maxsize
+        self.stats = PriceCacheStats()
+        self._schema_ready = False
+
+    @contextlib.asynccontextmanager
+    async def _connect(self) -> AsyncIterator['aiosqlite.Connection']:
+        """
+        Соединение открывается на каждую операцию: поток aiosqlite не демонический и
+        долгоживущее соединение не дает интерпретатору завершиться до срабатывания финализаторов.
+        """
+        import aiosqlite
+        async with aiosqlite.connect(self.path) as connection:
+            if not self._schema_ready:
+                await connection.execute('PRAGMA journal_mode=WAL')
+                await connection.execute(
+                    'CREATE TABLE IF NOT EXISTS price_cache ('
+                    'name TEXT PRIMARY KEY, '
+                    'price TEXT NOT NULL, '
+                    'expires_at REAL NOT NULL, '
+                    'accessed_at REAL NOT NULL)'
+                )
+                await connection.execute(
+                    'CREATE INDEX IF NOT EXISTS price_cache_accessed_at_ix ON price_cache (accessed_at)'
+                )
+                await connection.execute(
+                    'CREATE TABLE IF NOT EXISTS price_validators ('
+                    'key TEXT PRIMARY KEY, '
+                    'etag TEXT, '
+                    'last_modified TEXT, '
+                    'prices TEXT NOT NULL, '
+                    'accessed_at REAL NOT NULL)'
+                )
+                await connection.execute(
+                    'CREATE INDEX IF NOT EXISTS price_validators_accessed_at_ix ON price_validators (accessed_at)'
+                )
+                await connection.commit()
+                self._schema_ready = True
+            await connection.execute('PRAGMA synchronous=NORMAL')
+            yield connection
+
+    async def get_many(self, names: Iterable[str]) -> dict[str, decimal.Decimal]:
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+        now = time.time()
+        found, expired = {}, []
+        async with self._connect() as connection:
+            for start in range(0, len(names), SQLITE_IN_CHUNK):
+                chunk = names[start:start + SQLITE_IN_CHUNK]
+                async with connection.execute(
+                    f'SELECT name, price, expires_at FROM price_cache WHERE name IN ({",".join("?" * len(chunk))})',
+                    chunk,
+                ) as cursor:
+                    async for name, price, expires_at in cursor:
+                        if expires_at <= now:
+                            expired.append(name)
+                        else:
+                            found[name] = decimal.Decimal(price)
+
+            if found or expired:
+                await connection.executemany(
+                    'UPDATE price_cache SET accessed_at = ? WHERE name = ?',
+                    [(now, name) for name in found],
+                )
+                await connection.executemany('DELETE FROM price_cache WHERE name = ?', [(name, ) for name in expired])
+                await connection.commit()
+
+        self.stats.hits += len(found)
+        self.stats.misses += len(names) - len(found)
+        self.stats.expirations += len(expired)
+        return found
+
+    async def set_many(
+            self,
+            prices: Mapping[str, decimal.Decimal],
+            ttl: datetime.timedelta | None = None,
+    ) -> None:
+        if not prices:
+            return
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl).total_seconds()
+        async with self._connect() as connection:
+            await connection.executemany(
+                'INSERT INTO price_cache (name, price, expires_at, accessed_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET '
+                'price = excluded.price, expires_at = excluded.expires_at, accessed_at = excluded.accessed_at',
+                [(name, str(price), expires_at, now) for name, price in prices.items()],
+            )
+            cursor = await connection.execute(
+                'DELETE FROM price_cache WHERE name IN ('
+                'SELECT name FROM price_cache ORDER BY accessed_at '
+                'LIMIT max(0, (SELECT count(*) FROM price_cache) - ?))',
+                (self.maxsize, ),
+            )
+            self.stats.evictions += max(cursor.rowcount, 0)
+            await connection.commit()
+
+    async def get_validators(self, key: str) -> ChunkValidators | None:
+        async with self._connect() as connection:
+            async with connection.execute(
+                'SELECT etag, last_modified, prices FROM price_validators WHERE key = ?', (key, ),
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return None
+            await connection.execute('UPDATE price_validators SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            await connection.commit()
+        etag, last_modified, prices = row
+        return ChunkValidators(
+            etag, last_modified, {name: decimal.Decimal(price) for name, price in json.loads(prices).items()},
+        )
+
+    async def set_validators(self, key: str, validators: ChunkValidators | None) -> None:
+        async with self._connect() as connection:
+            if validators is None:
+                await connection.execute('DELETE FROM price_validators WHERE key = ?', (key, ))
+            else:
+                await connection.execute(
+                    'INSERT INTO price_validators (key, etag, last_modified, prices, accessed_at) '
+                    'VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (key) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified, '
+                    'prices = excluded.prices, accessed_at = excluded.accessed_at',
+                    (
+                        key,
+                        validators.etag,
+                        validators.last_modified,
+                        json.dumps({name: str(price) for name, price in validators.prices.items()}),
+                        time.time(),
+                    ),
+                )
+                await connection.execute(
+                    'DELETE FROM price_validators WHERE key IN ('
+                    'SELECT key FROM price_validators ORDER BY accessed_at '
+                    'LIMIT max(0, (SELECT count(*) FROM price_validators) - ?))',
+                    (self.validators_maxsize, ),
+                )
+            await connection.commit()
+
+    async def _finalize(self) -> None:
+        log.info('Price cache stats.', hit_ratio=self.stats.hit_ratio, **dataclasses.asdict(self.stats))
+
+
+def build_price_cache(backend: str = settings.price_cache_backend) -> PriceCacheRepository:
+    match PriceCacheBackend(backend):
+        case PriceCacheBackend.MEMORY:
+            return MemoryPriceCacheRepository()
+        case PriceCacheBackend.SQLITE:
+            return SQLitePriceCacheRepository()
@@ -0,0 +1,37 @@
+import enum
+from typing import TYPE_CHECKING
+
+from settings import settings
+from utils.enums import CaseInsensitiveMixin
+
+if TYPE_CHECKING:
+    from domain.price_sourcing_repository import CryptoPriceSourcingRepository
+
+__all__ = (
+    'PriceSource',
+    'build_price_source',
+)
+
+
+class PriceSource(CaseInsensitiveMixin, enum.StrEnum):
+    HTTP = 'http'
+    WS = 'ws'
+    CRYPTOCOMPARE = 'cryptocompare'
+    COMPOSITE = 'composite'
+
+
+def build_price_source(source: str = settings.price_source) -> 'CryptoPriceSourcingRepository':
+    # Импорты внутри веток, чтобы не поднимать клиент источника, который не используется.
+    match PriceSource(source):
+        case PriceSource.HTTP:
+            from adapter.http_price_sourcing_repository import repository
+            return repository
+        case PriceSource.WS:
+            from adapter.ws_price_sourcing_repository import repository
+            return repository
+        case PriceSource.CRYPTOCOMPARE:
+            from adapter.cryptocompare_price_sourcing_repository import repository
+            return repository
+        case PriceSource.COMPOSITE:
+            from adapter.composite_price_sourcing_repository import repository
+            return repository
@@ -1,20 +1,90 @@
+import asyncio
+import contextlib
 import os
-from typing import TYPE_CHECKING
-
-from telethon import TelegramClient
+from typing import Iterator, Sequence, TYPE_CHECKING
 
 from _secrets import telegram_api_hash, telegram_api_id, telegram_bot_token, telegram_user_id
 from domain.price_tg_repository import PriceMessangerRepository
+from utils.metrics import metrics
+from utils.singletone import ModuleSingletonAssigner
+from utils.weakref import Finalizable
 
 if TYPE_CHECKING:
+    from telethon import TelegramClient
+
     from domain.price import CryptoPrice
 
+__all__ = (
+    'PriceTGRepository',
+)
+
+# Ограничение Telegram на длину одного сообщения.
+TG_MESSAGE_MAX_LENGTH = 4096
+
+TG_SEND_SECONDS = metrics.histogram('tg_send_seconds', 'Время отправки одного сообщения в Telegram.')
+TG_ALERTS = metrics.counter('tg_alerts_total', 'Отправленные оповещения.')
+
+
+class PriceTGRepository(Finalizable, PriceMessangerRepository):
+    """
+    Один клиент на весь запуск: подключается и авторизуется при первой отправке,
+    закрывается в _finalize.
+    """
+    def __init__(self) -> None:
+        self._client: 'TelegramClient | None' = None
+        self._lock = asyncio.Lock()
+
+    async def _get_client(self) -> 'TelegramClient':
+        async with self._lock:
+            if self._client is None or not self._client.is_connected():
+                # telethon импортируется только когда есть что отправить: это самая тяжелая зависимость запуска.
+                from telethon import TelegramClient
 
-class PriceTGRepository(PriceMessangerRepository):
+                self._client = await TelegramClient(
+                    'bot', telegram_api_id, telegram_api_hash,
+                ).start(bot_token=telegram_bot_token)
+        return self._client
+
+    @staticmethod
+    def _format(price: 'CryptoPrice') -> str:
+        return (f'Цена на {price.standard_name.upper()} пересекла таргет {price.target}. {os.linesep}'
+                f'Текущая цена {price.current}.')
+
+    def _combine(self, prices: Sequence['CryptoPrice']) -> Iterator[str]:
+        """
+        Склеивает оповещения в сообщения не длиннее TG_MESSAGE_MAX_LENGTH.
+        """
+        separator = os.linesep * 2
+        message = ''
+        for price in prices:
+            line = self._format(price)
+            if message and len(message) + len(separator) + len(line) > TG_MESSAGE_MAX_LENGTH:
+                yield message
+                message = ''
+            message = f'{message}{separator}{line}' if message else line
+        if message:
+            yield message
 
     async def send(self, price: 'CryptoPrice') -> None:
-        message = (f'Цена на {price.standard_name.upper()} пересекла таргет {price.target}. {os.linesep}'
-                       f'Текущая цена {price.current}.')
-        bot = await TelegramClient('bot', telegram_api_id, telegram_api_hash).start(bot_token=telegram_bot_token)
-        async with bot as session:
-            await session.send_message(telegram_user_id, message=message)
+        await self.send_many([price])
+
+    async def send_many(self, prices: Sequence['CryptoPrice']) -> None:
+        # Все оповещения адресованы одному пользователю telegram_user_id.
+        client = await self._get_client()
+        for message in self._combine(prices):
+            with TG_SEND_SECONDS.time():
+                await client.send_message(telegram_user_id, message=message)
+        TG_ALERTS.inc(len(prices))
+
+    async def _finalize(self) -> None:
+        if self._client is not None:
+            with contextlib.suppress(Exception):
+                await self._client.disconnect()
+            self._client = None
+
+    def __call__(self, *args, **kwargs) -> 'PriceTGRepository':
+        return self
+
+
+repository: PriceTGRepository
+ModuleSingletonAssigner(PriceTGRepository, 'repository').assign()
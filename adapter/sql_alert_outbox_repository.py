@@ -0,0 +1,78 @@
+import datetime
+from typing import Sequence
+
+import sqlalchemy as sa
+
+from database import AlertOutboxORM
+from database.alchemy import db
+from domain.alert_outbox_repository import AlertOutboxRepository, OutboxAlert
+
+__all__ = (
+    'SQLAlertOutboxRepository',
+)
+
+
+class SQLAlertOutboxRepository(AlertOutboxRepository):
+    model = AlertOutboxORM
+    db = db
+
+    async def claim(
+            self,
+            now: datetime.datetime,
+            limit: int,
+            lease_until: datetime.datetime,
+    ) -> list[OutboxAlert]:
+        """
+        Один UPDATE ... RETURNING: выбор пачки и ее аренда атомарны, два отправителя не возьмут одни строки.
+        Сначала чтение по alert_outbox_pending_ix: пустой опрос, обычный случай, не открывает пишущую
+        транзакцию и не ждет блокировку записи SQLite за пайплайном.
+        """
+        model = self.model
+        due = sa.select(
+            model.id,
+        ).where(
+            model.sent_at.is_(None), model.next_attempt_at <= now,
+        ).order_by(
+            model.next_attempt_at, model.id,
+        )
+        async with self.db.async_session as session:
+            if (await session.execute(due.limit(1))).first() is None:
+                return []
+            rows = (await session.execute(
+                sa.update(model).where(
+                    model.id.in_(due.limit(limit).scalar_subquery()),
+                ).values(
+                    next_attempt_at=lease_until,
+                ).returning(
+                    model.id, model.attempts, model.price_id, model.ticker, model.standard_name,
+                    model.target, model.movement_direction, model.current,
+                )
+            )).all()
+            await session.commit()
+        return sorted(map(model.from_row, rows), key=lambda alert: alert.id)
+
+    async def mark_sent(self, ids: Sequence[int], now: datetime.datetime) -> None:
+        async with self.db.async_session as session:
+            await session.execute(sa.update(self.model).where(self.model.id.in_(ids)).values(sent_at=now))
+            await session.commit()
+
+    async def mark_failed(self, ids: Sequence[int], error: str, retry_at: datetime.datetime) -> None:
+        async with self.db.async_session as session:
+            await session.execute(
+                sa.update(self.model).where(
+                    self.model.id.in_(ids),
+                ).values(
+                    attempts=self.model.attempts + 1,
+                    next_attempt_at=retry_at,
+                    last_error=error,
+                )
+            )
+            await session.commit()
+
+    async def purge(self, sent_before: datetime.datetime) -> int:
+        async with self.db.async_session as session:
+            deleted = (await session.execute(
+                sa.delete(self.model).where(self.model.sent_at.is_not(None), self.model.sent_at < sent_before)
+            )).rowcount
+            await session.commit()
+        return deleted
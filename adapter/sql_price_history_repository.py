@@ -0,0 +1,173 @@
+import datetime
+from typing import AsyncIterator, Sequence
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.sqlite import insert
+
+from database import PriceCandleORM, PriceTickORM
+from database.alchemy import db
+from domain.price_history_repository import (
+    CompactionResult,
+    PriceCandle,
+    PriceHistoryRepository,
+    PriceTick,
+    bucket_start,
+)
+from settings import settings
+from utils.metrics import metrics
+
+__all__ = (
+    'SQLPriceHistoryRepository',
+)
+
+HISTORY_TICKS = metrics.counter('price_history_ticks_total', 'Записанные тики истории цен.')
+
+
+class SQLPriceHistoryRepository(PriceHistoryRepository):
+    tick_model = PriceTickORM
+    candle_model = PriceCandleORM
+    db = db
+
+    async def add_many(self, ticks: Sequence[PriceTick]) -> Sequence[PriceTick]:
+        """
+        Один executemany INSERT на пачку тиков в одной транзакции.
+        """
+        if not ticks:
+            return ticks
+        async with self.db.async_session as session:
+            await session.execute(
+                sa.insert(self.tick_model),
+                [self.tick_model.values_from_dto(tick) for tick in ticks],
+            )
+            await session.commit()
+        HISTORY_TICKS.inc(len(ticks))
+        return ticks
+
+    async def _stream(self, query: sa.Select, from_row) -> AsyncIterator:
+        async with self.db.async_session as session:
+            rows = await session.stream(query.execution_options(yield_per=settings.db_read_batch_size))
+            async for partition in rows.partitions():
+                for row in partition:
+                    yield from_row(row)
+
+    def ticks(
+            self,
+            standard_name: str,
+            start: datetime.datetime,
+            end: datetime.datetime,
+    ) -> AsyncIterator[PriceTick]:
+        model = self.tick_model
+        return self._stream(
+            sa.select(
+                model.standard_name, model.ts, model.price,
+            ).where(
+                model.standard_name == standard_name, model.ts >= start, model.ts < end,
+            ).order_by(
+                model.ts,
+            ),
+            model.from_row,
+        )
+
+    def candles(
+            self,
+            standard_name: str,
+            start: datetime.datetime,
+            end: datetime.datetime,
+    ) -> AsyncIterator[PriceCandle]:
+        model = self.candle_model
+        return self._stream(
+            sa.select(
+                model.standard_name, model.start, model.open, model.high, model.low, model.close, model.samples,
+                model.first_ts, model.last_ts,
+            ).where(
+                model.standard_name == standard_name, model.start >= start, model.start < end,
+            ).order_by(
+                model.start,
+            ),
+            model.from_row,
+        )
+
+    def _upsert_candles(self) -> sa.Insert:
+        """
+        Тик, пришедший уже после свертки своего интервала, досливается в существующую свечу.
+        Такой тик может быть старше уже свернутых (свертка и запись тиков в daemon режиме идут
+        параллельно), поэтому open и close меняются, только если он раньше первого или позже последнего.
+        """
+        model = self.candle_model
+        stmt = insert(model)
+        excluded = stmt.excluded
+        return stmt.on_conflict_do_update(
+            index_elements=[model.standard_name, model.start],
+            set_=dict(
+                open=sa.case((excluded.first_ts < model.first_ts, excluded.open), else_=model.open),
+                high=sa.func.max(model.high, excluded.high),
+                low=sa.func.min(model.low, excluded.low),
+                close=sa.case((excluded.last_ts > model.last_ts, excluded.close), else_=model.close),
+                samples=model.samples + excluded.samples,
+                first_ts=sa.func.min(model.first_ts, excluded.first_ts),
+                last_ts=sa.func.max(model.last_ts, excluded.last_ts),
+            ),
+        )
+
+    async def compact(
+            self,
+            cutoff: datetime.datetime,
+            resolution: datetime.timedelta,
+            candles_cutoff: datetime.datetime | None = None,
+    ) -> CompactionResult:
+        """
+        Тики старше cutoff (выровненного вниз до resolution, чтобы сворачивать только целые интервалы)
+        читаются стримом по (standard_name, ts), сворачиваются в свечи и пишутся пачками;
+        затем тики удаляются. Все - одной транзакцией: упавшая свертка не теряет сырые данные.
+        """
+        cutoff = bucket_start(cutoff, resolution)
+        model = self.tick_model
+        upsert = self._upsert_candles()
+        candles_written = 0
+        async with self.db.async_session as session:
+            rows = await session.stream(
+                sa.select(
+                    model.standard_name, model.ts, model.price,
+                ).where(
+                    model.ts < cutoff,
+                ).order_by(
+                    model.standard_name, model.ts,
+                ).execution_options(yield_per=settings.db_read_batch_size)
+            )
+            batch: list[PriceCandle] = []
+            candle: PriceCandle | None = None
+            async for partition in rows.partitions():
+                for standard_name, ts, price in partition:
+                    start = bucket_start(ts, resolution)
+                    if candle is not None and candle.standard_name == standard_name and candle.start == start:
+                        candle.high = max(candle.high, price)
+                        candle.low = min(candle.low, price)
+                        candle.close = price
+                        candle.samples += 1
+                        candle.last_ts = ts
+                        continue
+                    if candle is not None:
+                        batch.append(candle)
+                    candle = PriceCandle(standard_name, start, price, price, price, price, 1, ts, ts)
+                if len(batch) >= settings.db_write_batch_size:
+                    await session.execute(upsert, [self.candle_model.values_from_dto(c) for c in batch])
+                    candles_written += len(batch)
+                    batch = []
+            if candle is not None:
+                batch.append(candle)
+            if batch:
+                await session.execute(upsert, [self.candle_model.values_from_dto(c) for c in batch])
+                candles_written += len(batch)
+
+            ticks_deleted = (await session.execute(sa.delete(model).where(model.ts < cutoff))).rowcount
+            candles_deleted = 0
+            if candles_cutoff is not None:
+                candles_deleted = (await session.execute(
+                    sa.delete(self.candle_model).where(self.candle_model.start < candles_cutoff)
+                )).rowcount
+            await session.commit()
+        return CompactionResult(
+            candles=candles_written,
+            ticks_deleted=ticks_deleted,
+            candles_deleted=candles_deleted,
+        )
@@ -1,43 +1,120 @@
-from typing import AsyncIterator, TYPE_CHECKING
+from typing import AsyncIterator, Sequence, TYPE_CHECKING
 
 import sqlalchemy as sa
+from sqlalchemy.dialects.sqlite import insert
 
-from database import CryptoPriceORM
+from database import AlertOutboxORM, CryptoPriceORM
 from database.alchemy import db
 from domain.price_db_repository import CryptoPriceRepository
+from settings import settings
+from utils.metrics import metrics
 
 if TYPE_CHECKING:
     from domain.price import CryptoPrice
+    from utils.sharding import Shard
 
 __all__ = (
     'SQLPriceRepository',
 )
 
+DB_COMMIT_SECONDS = metrics.histogram('db_commit_seconds', 'Время записи и коммита транзакции.')
+DB_TRANSACTIONS = metrics.counter('db_transactions_total', 'Количество пишущих транзакций.')
+
 class SQLPriceRepository(CryptoPriceRepository):
     model = CryptoPriceORM
+    outbox_model = AlertOutboxORM
     db = db
+    supports_alert_outbox = True
+
+    def __init__(self, shard: 'Shard | None' = None) -> None:
+        # Только таргеты монет этого шарда: все таргеты одной монеты попадают в один шард.
+        self.shard = shard
+
+    def _active_where(self, query: sa.Select) -> sa.Select:
+        query = query.where(self.model.is_active == sa.true())
+        if self.shard is not None:
+            query = query.where(sa.func.crc32(self.model.standard_name) % self.shard.count == self.shard.index)
+        return query
+
+    def _active_query(self, *entities) -> sa.Select:
+        return self._active_where(sa.select(*entities)).order_by(
+            self.model.updated_at.asc().nulls_first(),
+            sa.func.abs(self.model.target - self.model.last_saved).asc(),
+        )
+
+    def _stream_query(self) -> sa.Select:
+        # Порядок колонок - порядок полей CryptoPrice, см. CryptoPriceORM.from_row.
+        return self._active_query(
+            self.model.ticker,
+            self.model.standard_name,
+            self.model.target,
+            self.model.movement_direction,
+            self.model.id,
+            self.model.last_saved,
+        ).execution_options(yield_per=settings.db_read_batch_size)
 
     async def all(self) -> list[CryptoPriceORM]:
         async with self.db.async_session as session:
-            res = await session.scalars(
-                sa.select(
-                    self.model
-                ).where(
-                    self.model.is_active == sa.true()
-                ).order_by(
-                    self.model.updated_at.asc().nulls_first(),
-                    sa.func.abs(self.model.target - self.model.last_saved).asc(),
-                )
-            )
+            res = await session.scalars(self._active_query(self.model))
             return res.all()
 
+    async def active_coins(self) -> dict[str, str]:
+        """Один GROUP BY по покрывающему active_scan_ix вместо стрима всех таргетов."""
+        query = self._active_where(
+            sa.select(self.model.standard_name, sa.func.min(self.model.ticker))
+        ).group_by(self.model.standard_name)
+        async with self.db.async_session as session:
+            return dict((await session.execute(query)).tuples().all())
+
     async def add(self, price: 'CryptoPrice') -> 'CryptoPrice':
         orm_price = self.model.from_dto(price)
         async with self.db.async_session as session:
-            await session.merge(orm_price)
-            await session.commit()
+            with DB_COMMIT_SECONDS.time(operation='add'):
+                await session.merge(orm_price)
+                await session.commit()
+        DB_TRANSACTIONS.inc(operation='add')
         return price
 
+    async def add_many(
+            self,
+            prices: Sequence['CryptoPrice'],
+            alerts: Sequence['CryptoPrice'] = (),
+    ) -> Sequence['CryptoPrice']:
+        """
+        Один INSERT ... ON CONFLICT DO UPDATE на всю пачку в одной транзакции вместо merge + commit на каждую цену.
+        Оповещения alerts пишутся в outbox той же транзакцией: деактивация таргета и его оповещение
+        фиксируются вместе или не фиксируются вовсе. Повторная запись оповещения таргета игнорируется.
+        """
+        if not prices:
+            return prices
+        stmt = insert(self.model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.model.id],
+            set_=dict(
+                last_saved=stmt.excluded.last_saved,
+                is_active=stmt.excluded.is_active,
+                updated_at=sa.func.now(),
+            ),
+        )
+        async with self.db.async_session as session:
+            with DB_COMMIT_SECONDS.time(operation='add_many'):
+                await session.execute(stmt, [self.model.values_from_dto(price) for price in prices])
+                if alerts:
+                    await session.execute(
+                        insert(self.outbox_model).on_conflict_do_nothing(index_elements=[self.outbox_model.price_id]),
+                        [self.outbox_model.values_from_dto(price) for price in alerts],
+                    )
+                await session.commit()
+        DB_TRANSACTIONS.inc(operation='add_many')
+        return prices
+
     async def __aiter__(self) -> AsyncIterator['CryptoPrice'] :
-        for target in await self.all():
-            yield target.to_dto(target)
+        """
+        Стримим только нужные CryptoPrice колонки пачками по settings.db_read_batch_size строк,
+        без ORM объектов и identity map, чтобы первые цены уходили в работу до окончания чтения таблицы.
+        """
+        async with self.db.async_session as session:
+            rows = await session.stream(self._stream_query())
+            async for partition in rows.partitions():
+                for row in partition:
+                    yield self.model.from_row(row)
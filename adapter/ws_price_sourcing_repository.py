@@ -0,0 +1,141 @@
+import asyncio
+import contextlib
+import datetime
+import decimal
+import time
+from typing import Sequence, TYPE_CHECKING
+
+from pydantic import BaseModel, Field, RootModel, ValidationError
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from domain.price_sourcing_repository import CryptoPriceSourcingRepository
+from settings import settings
+from utils.logging import log
+from utils.metrics import metrics
+from utils.singletone import ModuleSingletonAssigner
+from utils.weakref import Finalizable
+
+if TYPE_CHECKING:
+    from domain.price import CryptoPrice
+
+__all__ = (
+    'WebSocketCryptoPriceSourcingRepository',
+)
+
+# Снимок всех пар Binance в одном сообщении может весить сотни килобайт.
+WS_MAX_MESSAGE_SIZE = 8 * 1024 * 1024
+
+WS_TICKS = metrics.counter('ws_ticks_total', 'Обновления цен, полученные из потока.')
+WS_RECONNECTS = metrics.counter('ws_reconnects_total', 'Переподключения к потоку цен.')
+WS_LOOKUPS = metrics.counter('ws_price_lookups_total', 'Чтения таблицы последних цен: hit/stale/missing.')
+
+
+class Ticker(BaseModel):
+    symbol: str = Field(alias='s')
+    close: decimal.Decimal = Field(alias='c')
+
+
+class TickerMessage(RootModel[list[Ticker] | Ticker]):
+    pass
+
+
+class WebSocketCryptoPriceSourcingRepository(Finalizable, CryptoPriceSourcingRepository):
+    """
+    Держит одно постоянное подключение к потоку тикеров и таблицу последних цен в памяти.
+    fetch/fetch_many только читают таблицу - ни одного запроса на таргет.
+
+    Поток читается фоновой задачей, которая стартует при первом fetch и переподключается
+    с backoff при обрывах. Цена старше max_age считается неизвестной, такой таргет пропускается
+    до следующей проверки.
+    """
+    def __init__(
+            self,
+            url: str = settings.ws_url,
+            quote_asset: str = settings.ws_quote_asset,
+            max_age: datetime.timedelta = settings.ws_price_max_age,
+            ready_timeout: datetime.timedelta = settings.ws_ready_timeout,
+    ) -> None:
+        self.url = url
+        self.quote_asset = quote_asset.upper()
+        self.max_age = max_age.total_seconds()
+        self.ready_timeout = ready_timeout.total_seconds()
+        # symbol -> (цена, time.monotonic() получения).
+        self.prices: dict[str, tuple[decimal.Decimal, float]] = {}
+        self._task: asyncio.Task | None = None
+        self._ready = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    def symbol(self, price: 'CryptoPrice') -> str:
+        return f'{price.ticker}{self.quote_asset}'.upper()
+
+    async def _ensure_started(self) -> None:
+        async with self._lock:
+            if self._task is None or self._task.done():
+                self._ready = asyncio.Event()
+                self._task = asyncio.create_task(self._run(), name='ws-price-stream')
+        if not self._ready.is_set():
+            try:
+                await asyncio.wait_for(self._ready.wait(), self.ready_timeout)
+            except TimeoutError:
+                await log.awarning('No prices from the stream yet.', url=self.url, timeout=self.ready_timeout)
+
+    async def _run(self) -> None:
+        # connect как асинхронный итератор сам переподключается с экспоненциальным backoff.
+        async for websocket in connect(self.url, max_size=WS_MAX_MESSAGE_SIZE):
+            await log.ainfo('Connected to the price stream.', url=self.url)
+            with contextlib.suppress(ConnectionClosed):
+                async for message in websocket:
+                    self._apply(message)
+            WS_RECONNECTS.inc()
+            await log.awarning('Price stream closed, reconnecting.', url=self.url)
+
+    def _apply(self, message: str | bytes) -> None:
+        try:
+            validated = TickerMessage.model_validate_json(message)
+        except ValidationError:
+            # Служебные сообщения (ответы на подписку и т.п.) пропускаем.
+            return
+        tickers = validated.root if isinstance(validated.root, list) else [validated.root]
+        received_at = time.monotonic()
+        for ticker in tickers:
+            self.prices[ticker.symbol] = (ticker.close, received_at)
+        WS_TICKS.inc(len(tickers))
+        self._ready.set()
+
+    def current_price(self, symbol: str) -> decimal.Decimal | None:
+        if (entry := self.prices.get(symbol)) is None:
+            WS_LOOKUPS.inc(result='missing')
+            return None
+        current, received_at = entry
+        if time.monotonic() - received_at > self.max_age:
+            WS_LOOKUPS.inc(result='stale')
+            return None
+        WS_LOOKUPS.inc(result='hit')
+        return current
+
+    async def fetch(self, price: 'CryptoPrice') -> 'CryptoPrice':
+        await self.fetch_many([price])
+        return price
+
+    async def fetch_many(self, prices: Sequence['CryptoPrice']) -> Sequence['CryptoPrice']:
+        await self._ensure_started()
+        for price in prices:
+            price.current = self.current_price(self.symbol(price))
+        return prices
+
+    async def _finalize(self) -> None:
+        task, self._task = self._task, None
+        # Задачу из уже закрытого цикла (однократный запуск) отменил сам asyncio.run.
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            return
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await task
+
+    def __call__(self, *args, **kwargs) -> 'WebSocketCryptoPriceSourcingRepository':
+        return self
+
+
+repository: WebSocketCryptoPriceSourcingRepository
+ModuleSingletonAssigner(WebSocketCryptoPriceSourcingRepository, 'repository').assign()
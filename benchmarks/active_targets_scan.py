@@ -0,0 +1,97 @@
+"""
+План и время выборки активных таргетов с индексом active_scan_ix и без него.
+
+    uv run python -m benchmarks.active_targets_scan --rows 100000
+"""
+import argparse
+import contextlib
+import decimal
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import sqlite
+
+from adapter.sql_price_repository import SQLPriceRepository
+from database import ORMBase
+from domain.price import CryptoPriceMovementDirection
+
+
+def seed(path: Path, rows: int, coins: int = 500) -> None:
+    engine = sa.create_engine(f'sqlite:///{path}')
+    ORMBase.metadata.create_all(engine)
+    engine.dispose()
+
+    rnd = random.Random(42)
+    connection = sqlite3.connect(path)
+    connection.executemany(
+        'INSERT INTO cryptoprice '
+        '(target, ticker, standard_name, movement_direction, last_saved, is_active, updated_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (
+            (
+                str(decimal.Decimal(rnd.uniform(1, 100_000)).quantize(decimal.Decimal('0.01'))),
+                f'ticker{i}',
+                f'coin{i % coins}',
+                rnd.choice(list(CryptoPriceMovementDirection)).name,
+                str(decimal.Decimal(rnd.uniform(1, 100_000)).quantize(decimal.Decimal('0.01'))),
+                rnd.random() < 0.8,
+                None if rnd.random() < 0.1 else f'2025-12-{rnd.randint(1, 28):02d} {rnd.randint(0, 23):02d}:00:00',
+            )
+            for i in range(rows)
+        ),
+    )
+    connection.commit()
+    connection.execute('ANALYZE')
+    connection.close()
+
+
+def measure(path: Path, query: str, repeat: int) -> dict:
+    # Новое соединение на каждый замер, иначе кэш стейтментов sqlite3 отдает старый план.
+    connection = sqlite3.connect(path)
+    plan = [row[-1] for row in connection.execute(f'EXPLAIN QUERY PLAN {query}')]
+    full, first = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor = connection.execute(query)
+        cursor.fetchone()
+        first.append(time.perf_counter() - started)
+        cursor.fetchall()
+        full.append(time.perf_counter() - started)
+    connection.close()
+    return dict(plan=plan, first_row=min(first), full_scan=min(full))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    query = str(
+        SQLPriceRepository()._stream_query().compile(
+            dialect=sqlite.dialect(),
+            compile_kwargs={'literal_binds': True},
+        )
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'bench.db'
+        seed(path, args.rows)
+        with_index = measure(path, query, args.repeat)
+        with contextlib.closing(sqlite3.connect(path)) as connection:
+            connection.execute('DROP INDEX active_scan_ix')
+        without_index = measure(path, query, args.repeat)
+
+    print(query, end='\n\n')
+    for name, result in (('without active_scan_ix', without_index), ('with active_scan_ix', with_index)):
+        print(f'{name}:')
+        for line in result['plan']:
+            print(f'    {line}')
+        print(f'    first row: {result["first_row"] * 1000:.2f} ms, full scan: {result["full_scan"] * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
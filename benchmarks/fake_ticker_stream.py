@@ -0,0 +1,63 @@
+"""
+Локальная замена потока mini ticker Binance для WebSocketCryptoPriceSourcingRepository.
+Раз в interval рассылает всем подключенным клиентам массив тикеров со случайным блужданием цены.
+
+    uv run python -m benchmarks.fake_ticker_stream --port 8765 --symbols BTCUSDT ETHUSDT
+    # settings.price_source = 'ws', settings.ws_url = 'ws://127.0.0.1:8765'
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from websockets.asyncio.server import broadcast, serve
+
+
+class FakeTickerStream:
+    def __init__(self, prices: dict[str, float], interval: float, seed: int = 42) -> None:
+        self.prices = prices
+        self.interval = interval
+        self.random = random.Random(seed)
+        self.server = None
+
+    def snapshot(self) -> str:
+        event_time = int(time.time() * 1000)
+        for symbol, price in self.prices.items():
+            self.prices[symbol] = round(price * (1 + self.random.uniform(-0.01, 0.01)), 8)
+        return json.dumps([
+            {'e': '24hrMiniTicker', 'E': event_time, 's': symbol, 'c': str(price)}
+            for symbol, price in self.prices.items()
+        ])
+
+    async def _handler(self, websocket) -> None:
+        # Новый клиент сразу получает снимок, дальше - общую рассылку.
+        await websocket.send(self.snapshot())
+        await websocket.wait_closed()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        async with serve(self._handler, host, port) as self.server:
+            while True:
+                await asyncio.sleep(self.interval)
+                broadcast(self.server.connections, self.snapshot())
+
+    @property
+    def url(self) -> str:
+        host, port = next(iter(self.server.sockets)).getsockname()[:2]
+        return f'ws://{host}:{port}'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--symbols', nargs='+', default=['BTCUSDT', 'ETHUSDT', 'SOLUSDT'])
+    parser.add_argument('--interval', type=float, default=1.0, help='Период рассылки, с.')
+    args = parser.parse_args()
+
+    stream = FakeTickerStream({symbol: random.uniform(1, 100_000) for symbol in args.symbols}, args.interval)
+    asyncio.run(stream.serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+Сквозной прогон CheckTargetsUseCase на локальных заглушках: фейковый CoinGecko на httpx.MockTransport
+(задержка и доля 429 настраиваются, ответы сжимаются gzip и несут ETag и Cache-Control), SQLite
+с N таргетами и мессенджер, который ничего не отправляет.
+
+    uv run python -m benchmarks.pipeline --sizes 100 10000 100000 --latency 50 --rate-limited 0.05
+    uv run python -m benchmarks.pipeline --sizes 10000 --runs 2 --no-gzip
+
+С --runs > 1 проверка повторяется с пустым кэшем цен: повторные запросы условные и получают 304.
+
+Каждый размер прогоняется в отдельном процессе во временном каталоге, чтобы пиковый RSS
+и метрики не смешивались между прогонами.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from domain.price_tg_repository import PriceMessangerRepository
+from utils.metrics import metrics
+
+ROOT = Path(__file__).resolve().parent.parent
+
+FAKE_BYTES = metrics.counter('bench_fake_api_bytes_total', 'Байты тел ответов фейкового api.')
+
+
+class NoopMessangerRepository(PriceMessangerRepository):
+    def __init__(self) -> None:
+        self.sent = 0
+
+    async def send(self, price):
+        self.sent += 1
+        return price
+
+    async def send_many(self, prices) -> None:
+        self.sent += len(prices)
+
+
+class FakeCoinGecko:
+    """
+    Отвечает на simple/price детерминированной ценой для каждого id. Доля ответов 429 с Retry-After.
+    Тело сжимается gzip, если клиент его принимает; ETag - хэш тела, на совпавший If-None-Match - 304.
+    """
+    def __init__(
+            self,
+            latency: float,
+            rate_limited: float,
+            retry_after: float,
+            seed: int = 42,
+            compress: bool = True,
+            max_age: int = 30,
+    ) -> None:
+        self.latency = latency
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.compress = compress
+        self.max_age = max_age
+        self.requests = 0
+        self.rate_limited_responses = 0
+        self.not_modified_responses = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.random.random() < self.rate_limited:
+            self.rate_limited_responses += 1
+            return httpx.Response(429, headers={'Retry-After': str(self.retry_after)})
+        ids = request.url.params['ids'].split(',')
+        currency = request.url.params['vs_currencies']
+        body = json.dumps(
+            {_id: {currency: round(random.Random(_id).uniform(1, 100_000), 2)} for _id in ids}
+        ).encode()
+        etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+        headers = {'etag': etag, 'cache-control': f'public, max-age={self.max_age}', 'content-type': 'application/json'}
+        if request.headers.get('if-none-match') == etag:
+            self.not_modified_responses += 1
+            return httpx.Response(304, headers=headers)
+        if self.compress and 'gzip' in request.headers.get('accept-encoding', ''):
+            body = gzip.compress(body)
+            headers['content-encoding'] = 'gzip'
+        FAKE_BYTES.inc(len(body))
+        return httpx.Response(200, headers=headers, content=body)
+
+
+def fake_sourcing(sourcing, latency: float, rate_limited: float, retry_after: float, compress: bool, rate_limit: float):
+    from adapter.price_cache_repository import MemoryPriceCacheRepository
+    from settings import settings
+    from utils.rate_limiter import AdaptiveRateLimiter
+
+    sourcing.client = httpx.AsyncClient(
+        transport=httpx.MockTransport(FakeCoinGecko(latency / 1000, rate_limited, retry_after, compress=compress)),
+    )
+    sourcing.cache = MemoryPriceCacheRepository()
+    # Лимитер настоящего api здесь только мерил бы паузы между запросами, а не пайплайн.
+    sourcing.rate_limiter = AdaptiveRateLimiter(
+        rate=rate_limit,
+        burst=settings.api_rate_burst,
+        min_rate=settings.api_rate_limit_min,
+        max_rate=max(rate_limit, settings.api_rate_limit_max),
+        step=settings.api_rate_limit_step,
+        backoff_base=settings.api_backoff_base,
+        backoff_max=settings.api_backoff_max,
+    )
+    return sourcing
+
+
+def init_shard_worker(*fake_args) -> None:
+    """
+    Инициализатор воркера ShardedCheckTargetsUseCase: тот же фейковый api вместо синглтона http источника.
+    """
+    from utils.logging import configure_logging
+    configure_logging(profile='prod', level='WARNING')
+    from adapter.http_price_sourcing_repository import repository
+    fake_sourcing(repository, *fake_args)
+
+
+async def run_once(args: argparse.Namespace) -> dict:
+    from adapter.http_price_sourcing_repository import (
+        HTTP_VALIDATE_SECONDS,
+        HTTP_RESPONSES,
+        HTTPCryptoPriceSourcingRepository,
+    )
+    from adapter.price_cache_repository import MemoryPriceCacheRepository
+    from adapter.sql_price_repository import DB_TRANSACTIONS
+    from database.alchemy import db
+    from usecases.check_targets import CheckTargetsUseCase
+    from usecases.send_alerts import SendAlertsUseCase
+    from usecases.sharded_check_targets import ShardedCheckTargetsUseCase
+
+    fake_args = (args.latency, args.rate_limited, args.retry_after, not args.no_gzip, args.rate_limit)
+    messenger = NoopMessangerRepository()
+    sourcing = None
+    if args.shards > 1:
+        use_case = ShardedCheckTargetsUseCase(
+            args.shards, tg_repo=messenger, initializer=init_shard_worker, initargs=fake_args,
+        )
+    else:
+        sourcing = HTTPCryptoPriceSourcingRepository(cache=MemoryPriceCacheRepository())
+        use_case = CheckTargetsUseCase(targets_repo=fake_sourcing(sourcing, *fake_args), tg_repo=messenger)
+
+    started = time.perf_counter()
+    for _ in range(args.runs):
+        if sourcing is not None:
+            # Цены из кэша убираем на каждый прогон, иначе повторные прогоны не дошли бы до api.
+            # Валидаторы остаются - как в SQLite кэше, когда цены прошлого запуска истекли.
+            sourcing.cache._entries.clear()
+        await use_case.execute()
+    wall = time.perf_counter() - started
+    # В режиме outbox пайплайн только записал оповещения, отправляет их разбор outbox - вне замера wall.
+    await SendAlertsUseCase(tg_repo=messenger).execute()
+
+    if sourcing is not None:
+        await sourcing.client.aclose()
+    else:
+        await use_case.finalize()
+    await db.dispose()
+    # Счетчики воркеров шардов координатор уже сложил в свои; гистограммы - нет.
+    responses = HTTP_RESPONSES.summary()
+    validate = HTTP_VALIDATE_SECONDS.summary().get('', {})
+    return dict(
+        targets=args.child,
+        shards=args.shards,
+        wall_s=round(wall, 3),
+        targets_per_s=round(args.child * args.runs / wall, 1),
+        http_requests=int(sum(responses.values())),
+        http_429=int(responses.get('status=429', 0)),
+        http_304=int(responses.get('status=304', 0)),
+        # num_bytes_downloaded у ответов MockTransport всегда 0, поэтому байты считает заглушка.
+        http_kb=round(sum(FAKE_BYTES.summary().values()) / 1024, 1),
+        validate_cpu_us=round(validate['avg'] * 1e6, 1) if validate else '-',
+        db_transactions=int(sum(DB_TRANSACTIONS.summary().values())),
+        alerts=messenger.sent,
+        peak_rss_mb=round(max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        ) / 1024, 1),
+    )
+
+
+def child(args: argparse.Namespace) -> None:
+    # Логи на каждый таргет мерили бы stdout, а не пайплайн.
+    from utils.logging import configure_logging
+    configure_logging(profile='prod', level='WARNING')
+    from benchmarks.active_targets_scan import seed
+
+    seed(Path('crypto_price_db.db'), args.child, coins=args.coins or max(1, args.child // 10))
+    print(json.dumps(asyncio.run(run_once(args))))
+
+
+def parent(args: argparse.Namespace) -> None:
+    passthrough = [
+        '--latency', str(args.latency),
+        '--rate-limited', str(args.rate_limited),
+        '--retry-after', str(args.retry_after),
+        '--rate-limit', str(args.rate_limit),
+        '--coins', str(args.coins),
+        '--runs', str(args.runs),
+        '--shards', str(args.shards),
+        *(['--no-gzip'] if args.no_gzip else []),
+    ]
+    env = os.environ | {'PYTHONPATH': os.pathsep.join(filter(None, (str(ROOT), os.environ.get('PYTHONPATH'))))}
+    results = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.pipeline', '--child', str(size), *passthrough],
+                cwd=tmp,
+                env=env,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    columns = list(results[0])
+    print(' '.join(f'{column:>15}' for column in columns))
+    for result in results:
+        print(' '.join(f'{result[column]:>15}' for column in columns))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10_000, 100_000])
+    parser.add_argument('--coins', type=int, default=0, help='Сколько разных монет, по умолчанию N / 10.')
+    parser.add_argument('--latency', type=float, default=50, help='Задержка ответа api, мс.')
+    parser.add_argument('--rate-limited', type=float, default=0.0, help='Доля ответов 429.')
+    parser.add_argument('--retry-after', type=float, default=0.1, help='Retry-After в ответах 429, с.')
+    parser.add_argument('--rate-limit', type=float, default=100.0, help='Стартовая скорость лимитера, запросов/с.')
+    parser.add_argument('--runs', type=int, default=1, help='Сколько проверок подряд в одном процессе.')
+    parser.add_argument('--shards', type=int, default=1, help='Процессов ShardedCheckTargetsUseCase, 1 - без шардов.')
+    parser.add_argument('--no-gzip', action='store_true', help='Отвечать без сжатия.')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args)
+    else:
+        parent(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Память и время загрузки N активных таргетов в CryptoPrice: стриминг строк через
+SQLPriceRepository.__aiter__ против ORM сущностей (SQLPriceRepository.all) + to_dto.
+
+    uv run python -m benchmarks.price_memory --rows 100000
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+
+async def load_streamed(repository) -> list:
+    return [price async for price in repository]
+
+
+async def load_orm(repository) -> list:
+    return [repository.model.to_dto(orm_price) for orm_price in await repository.all()]
+
+
+async def measure(name: str, loader, repository) -> dict:
+    # Время - отдельным прогоном: tracemalloc сам замедляет каждую аллокацию в разы.
+    gc.collect()
+    started = time.perf_counter()
+    await loader(repository)
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    prices = await loader(repository)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(prices)
+    return dict(
+        path=name,
+        targets=count,
+        load_s=round(elapsed, 3),
+        us_per_target=round(elapsed / count * 1e6, 2),
+        retained_b_per_target=round((retained - baseline) / count),
+        peak_mb=round((peak - baseline) / 2 ** 20, 1),
+        instance_b=sys.getsizeof(prices[0]) + (sys.getsizeof(prices[0].__dict__) if hasattr(prices[0], '__dict__') else 0),
+    )
+
+
+async def run() -> list[dict]:
+    from adapter.sql_price_repository import SQLPriceRepository
+    from database.alchemy import db
+
+    repository = SQLPriceRepository()
+    results = [
+        await measure('stream rows -> CryptoPrice', load_streamed, repository),
+        await measure('ORM entities -> to_dto', load_orm, repository),
+    ]
+    await db.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # settings.db_addr указывает на файл в текущем каталоге.
+        os.chdir(tmp)
+        from benchmarks.active_targets_scan import seed
+        from utils.logging import configure_logging
+        configure_logging(profile='prod', level='WARNING')
+
+        seed(Path('crypto_price_db.db'), args.rows)
+        results = asyncio.run(run())
+
+    columns = list(results[0])
+    print(' | '.join(f'{column:>26}' for column in columns))
+    for result in results:
+        print(' | '.join(f'{result[column]!s:>26}' for column in columns))
+
+
+if __name__ == '__main__':
+    main()
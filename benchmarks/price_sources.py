@@ -0,0 +1,348 @@
+"""
+Задержка получения цен пачки из одного источника против CompositeCryptoPriceSourcingRepository
+на локальных заглушках CoinGecko и CryptoCompare (httpx.MockTransport) с хвостом задержек и ошибками.
+
+    uv run python -m benchmarks.price_sources --rounds 200 --latency 50 --spike 0.1 --spike-latency 2000
+
+Хвост задержек - доля запросов, которые отвечают spike-latency мс вместо latency; ошибки - доля ответов 500.
+
+    uv run python -m benchmarks.price_sources --check-overlap
+
+Проверка пересекающихся fetch_many композитного источника. На фейковых источниках: отмена проигравшего
+гонку запроса первого вызова доходит до второго. На настоящем HTTPCryptoPriceSourcingRepository поверх
+MockTransport: каждая монета запрашивается у заглушки один раз на оба вызова, а запрос, проигравший hedge
+обоим вызовам, отменяется, а не дожидается ответа. Падает с кодом 1, если вызов потерял цены,
+отмена вышла из fetch_many, монета запрошена дважды или проигравший запрос не отменен.
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import decimal
+import random
+import statistics
+import sys
+import time
+from typing import TYPE_CHECKING
+
+import httpx
+
+from benchmarks.pipeline import FakeCoinGecko
+from domain.price_sourcing_repository import CryptoPriceSourcingRepository
+
+if TYPE_CHECKING:
+    from adapter.http_price_sourcing_repository import HTTPCryptoPriceSourcingRepository
+
+
+class FakeCryptoCompare:
+    """
+    Отвечает на pricemulti ценой по тикеру, немного отличающейся от цены FakeCoinGecko.
+    """
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        currency = request.url.params['tsyms']
+        return httpx.Response(
+            200,
+            json={
+                symbol: {currency: round(random.Random(symbol.lower()).uniform(1, 100_000) * 1.001, 2)}
+                for symbol in request.url.params['fsyms'].split(',')
+            },
+        )
+
+
+class Unreliable:
+    """
+    Обертка над заглушкой: доля запросов с задержкой spike_latency вместо latency и доля ответов 500.
+    """
+    def __init__(self, handler, latency: float, spike: float, spike_latency: float, errors: float, seed: int) -> None:
+        self.handler = handler
+        self.latency = latency
+        self.spike = spike
+        self.spike_latency = spike_latency
+        self.errors = errors
+        self.random = random.Random(seed)
+        self.requests = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        delay = self.spike_latency if self.random.random() < self.spike else self.latency
+        failed = self.random.random() < self.errors
+        await asyncio.sleep(delay)
+        if failed:
+            return httpx.Response(500)
+        return await self.handler(request)
+
+
+class RecordingCoinGecko:
+    """
+    Заглушка CoinGecko с задержкой latency, которая помнит, сколько раз запрошена каждая монета
+    и чем закончился каждый запрос: ответом или отменой.
+    """
+    def __init__(self, latency: float) -> None:
+        self.handler = FakeCoinGecko(0, 0, 0)
+        self.latency = latency
+        self.ids = collections.Counter()
+        self.completed = 0
+        self.cancelled = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.ids.update(request.url.params['ids'].split(','))
+        try:
+            await asyncio.sleep(self.latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        self.completed += 1
+        return await self.handler(request)
+
+
+def uncached_http_source(handler) -> 'HTTPCryptoPriceSourcingRepository':
+    """
+    Настоящий HTTPCryptoPriceSourcingRepository поверх MockTransport, без кэша цен и без пауз лимитера:
+    каждый вызов доходит до заглушки, если его не покрыл уже идущий запрос.
+    """
+    from adapter.http_price_sourcing_repository import HTTPCryptoPriceSourcingRepository
+    from adapter.price_cache_repository import MemoryPriceCacheRepository
+    from utils.rate_limiter import AdaptiveRateLimiter
+
+    class Uncached(MemoryPriceCacheRepository):
+        async def get_many(self, names):
+            return {}
+
+    repository = HTTPCryptoPriceSourcingRepository(cache=Uncached())
+    repository.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    repository.rate_limiter = AdaptiveRateLimiter(
+        rate=1_000,
+        burst=1_000,
+        min_rate=1,
+        max_rate=1_000,
+        step=1,
+        backoff_base=datetime.timedelta(0),
+        backoff_max=datetime.timedelta(0),
+    )
+    return repository
+
+
+class SharedFlightSource(CryptoPriceSourcingRepository):
+    """
+    Источник, в котором конкурентные вызовы ждут запрос первого, а отмена первого доходит
+    до остальных как CancelledError - так вел себя single-flight http источника до исправления.
+    """
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.flight: asyncio.Future | None = None
+
+    async def fetch(self, price):
+        await self.fetch_many([price])
+        return price
+
+    async def fetch_many(self, prices):
+        if self.flight is None:
+            self.flight = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.sleep(self.delay)
+            except asyncio.CancelledError:
+                self.flight.cancel()
+                raise
+            self.flight.set_result(decimal.Decimal(1))
+        current = await asyncio.shield(self.flight)
+        for price in prices:
+            price.current = current
+        return prices
+
+
+class FixedSource(CryptoPriceSourcingRepository):
+    def __init__(self, delay: float, current: decimal.Decimal) -> None:
+        self.delay = delay
+        self.current = current
+
+    async def fetch(self, price):
+        await self.fetch_many([price])
+        return price
+
+    async def fetch_many(self, prices):
+        await asyncio.sleep(self.delay)
+        for price in prices:
+            price.current = self.current
+        return prices
+
+
+async def overlapping_calls(repository, coins: int) -> tuple[list, list, list[str]]:
+    """
+    Два fetch_many одних монет, второй начинается, пока первый ждет источник.
+    """
+    first, second = make_prices(coins), make_prices(coins)
+
+    async def second_call():
+        await asyncio.sleep(0.005)
+        return await repository.fetch_many(second)
+
+    outcomes = await asyncio.gather(repository.fetch_many(first), second_call(), return_exceptions=True)
+    failures = [
+        f'fetch_many call {number} raised {outcome!r}'
+        for number, outcome in enumerate(outcomes, 1)
+        if isinstance(outcome, BaseException)
+    ]
+    return first, second, failures
+
+
+async def check_overlap_http() -> list[str]:
+    """
+    Композит над настоящим http источником. Медленный CoinGecko проигрывает hedge обоим вызовам:
+    запрос один на оба и отменяется, когда его перестал ждать последний вызов. Быстрый CoinGecko
+    отвечает обоим вызовам одним запросом.
+    """
+    from adapter.composite_price_sourcing_repository import CompositeCryptoPriceSourcingRepository
+
+    failures = []
+    fast = decimal.Decimal(9)
+    for latency, hedged in ((0.5, True), (0.02, False)):
+        upstream = RecordingCoinGecko(latency)
+        http = uncached_http_source(upstream)
+        repository = CompositeCryptoPriceSourcingRepository(
+            dict(http=http, fixed=FixedSource(delay=0.05 if hedged else 0.5, current=fast)),
+            aggregation='first',
+            hedge_delay=0.01 if hedged else 0.1,
+        )
+        first, second, call_failures = await overlapping_calls(repository, coins=3)
+        # Отмена доходит до заглушки на следующей итерации цикла.
+        await asyncio.sleep(0.01)
+        scenario = 'hedged' if hedged else 'http wins'
+        failures += [f'{scenario}: {failure}' for failure in call_failures]
+        if duplicated := sorted(name for name, count in upstream.ids.items() if count > 1):
+            failures.append(f'{scenario}: coins requested more than once: {duplicated}')
+        for number, prices in enumerate((first, second), 1):
+            currents = [price.current for price in prices]
+            if None in currents or hedged != all(current == fast for current in currents):
+                failures.append(f'{scenario}: fetch_many call {number} got {currents}')
+        if hedged and (upstream.completed or not upstream.cancelled):
+            failures.append(
+                f'{scenario}: losing request was not cancelled '
+                f'(completed {upstream.completed}, cancelled {upstream.cancelled})'
+            )
+        await http.client.aclose()
+    return failures
+
+
+async def check_overlap() -> list[str]:
+    """
+    Первый вызов владеет запросом медленного shared, второй ждет его же. Оба по hedge_delay спрашивают fast,
+    первый получает цену и отменяет свой запрос к shared - второй видит в shared чужую отмену.
+    Она должна засчитаться shared как ошибка, а цена второго вызова - прийти из fast.
+    """
+    from adapter.composite_price_sourcing_repository import CompositeCryptoPriceSourcingRepository
+
+    fast = decimal.Decimal(9)
+    repository = CompositeCryptoPriceSourcingRepository(
+        dict(shared=SharedFlightSource(delay=0.5), fast=FixedSource(delay=0.05, current=fast)),
+        aggregation='first',
+        hedge_delay=0.01,
+    )
+    first, second, failures = await overlapping_calls(repository, coins=3)
+    for number, prices in enumerate((first, second), 1):
+        if any(price.current != fast for price in prices):
+            failures.append(f'fetch_many call {number} got {[price.current for price in prices]}, expected {fast}')
+    if repository.stats['shared'].errors != 1:
+        failures.append(f'shared source errors {repository.stats["shared"].errors}, expected 1')
+    return failures + await check_overlap_http()
+
+
+def make_prices(coins: int) -> list:
+    from domain.price import CryptoPrice, CryptoPriceMovementDirection
+    return [
+        CryptoPrice(f'COIN-{n}', f'coin-{n}', 1, CryptoPriceMovementDirection.UP)
+        for n in range(coins)
+    ]
+
+
+async def measure(name: str, repository, servers: dict[str, Unreliable], args: argparse.Namespace) -> dict:
+    for server in servers.values():
+        server.requests = 0
+    timings, missing = [], 0
+    for _ in range(args.rounds):
+        prices = make_prices(args.coins)
+        started = time.perf_counter()
+        try:
+            await repository.fetch_many(prices)
+        except Exception:
+            pass
+        timings.append(time.perf_counter() - started)
+        missing += sum(price.current is None for price in prices)
+    quantiles = statistics.quantiles(timings, n=100)
+    return dict(
+        source=name,
+        p50_ms=round(quantiles[49] * 1000, 1),
+        p95_ms=round(quantiles[94] * 1000, 1),
+        p99_ms=round(quantiles[98] * 1000, 1),
+        missing=missing,
+        **{f'{server}_requests': value.requests for server, value in servers.items()},
+    )
+
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    from adapter.composite_price_sourcing_repository import CompositeCryptoPriceSourcingRepository
+    from adapter.cryptocompare_price_sourcing_repository import CryptoComparePriceSourcingRepository
+
+    latency, spike_latency = args.latency / 1000, args.spike_latency / 1000
+    servers = {
+        'coingecko': Unreliable(
+            FakeCoinGecko(0, 0, 0), latency, args.spike, spike_latency, args.errors, seed=1,
+        ),
+        'cryptocompare': Unreliable(
+            FakeCryptoCompare(), latency * 1.5, args.spike, spike_latency, args.errors, seed=2,
+        ),
+    }
+
+    coingecko = uncached_http_source(servers['coingecko'])
+    cryptocompare = CryptoComparePriceSourcingRepository(base_url='https://cryptocompare.test/data/pricemulti')
+    cryptocompare.client = httpx.AsyncClient(transport=httpx.MockTransport(servers['cryptocompare']))
+
+    sources = dict(http=coingecko, cryptocompare=cryptocompare)
+    hedge_delay = args.hedge_delay / 1000
+    results = [
+        await measure('coingecko only', coingecko, servers, args),
+        await measure(
+            'composite first',
+            CompositeCryptoPriceSourcingRepository(sources, aggregation='first', hedge_delay=hedge_delay),
+            servers, args,
+        ),
+        await measure(
+            'composite median',
+            CompositeCryptoPriceSourcingRepository(sources, aggregation='median', hedge_delay=hedge_delay, quorum=2),
+            servers, args,
+        ),
+    ]
+    await coingecko.client.aclose()
+    await cryptocompare.client.aclose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--coins', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=50, help='Обычная задержка ответа, мс.')
+    parser.add_argument('--spike', type=float, default=0.1, help='Доля запросов с задержкой spike-latency.')
+    parser.add_argument('--spike-latency', type=float, default=1000, help='Задержка хвоста, мс.')
+    parser.add_argument('--errors', type=float, default=0.05, help='Доля ответов 500.')
+    parser.add_argument('--hedge-delay', type=float, default=150, help='Через сколько мс спрашивать следующий источник.')
+    parser.add_argument('--check-overlap', action='store_true', help='Только проверка пересекающихся вызовов.')
+    args = parser.parse_args()
+
+    from utils.logging import configure_logging
+    configure_logging(profile='prod', level='ERROR')
+    if args.check_overlap:
+        failures = asyncio.run(check_overlap())
+        for failure in failures:
+            print(f'FAIL: {failure}', file=sys.stderr)
+        print('overlapping fetch_many: ' + ('FAIL' if failures else 'ok'))
+        sys.exit(1 if failures else 0)
+    results = asyncio.run(run(args))
+
+    columns = list(results[0])
+    print(' | '.join(f'{column:>20}' for column in columns))
+    for result in results:
+        print(' | '.join(f'{result[column]!s:>20}' for column in columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Время старта main.py до первого запроса - импорт main и создание use case, как в main.build_use_case, -
+и проверка бюджета: запуск по таймеру платит его каждый раз. Импорты по пакетам - по -X importtime.
+
+    uv run python -m benchmarks.startup --repeat 7
+
+Падает с кодом 1, если медиана старта больше BUDGET_MS или если при старте загрузился
+модуль из LAZY_MODULES - они должны импортироваться только при первом использовании.
+"""
+import argparse
+import collections
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Бюджет на старт (медиана, мс). Поднимать только осознанно, вместе с причиной в коммите.
+BUDGET_MS = 250
+
+# Тяжелые зависимости, которые не нужны, пока до них не дошел запуск.
+LAZY_MODULES = ('telethon', 'websockets', 'numpy', 'httpx', 'h2', 'aiosqlite')
+
+# Путь python main.py без аргументов до anyio.run: дальше время уходит уже на работу.
+ENTRY = (
+    'import time; started = time.perf_counter(); '
+    'import main; main.build_use_case(1); '
+    'print(time.perf_counter() - started, flush=True)'
+)
+
+
+def start_main(importtime: bool = False) -> tuple[float, dict[str, int], float]:
+    """
+    Один старт в чистом процессе: время импорта main и создания use case (с),
+    self время импорта по пакетам верхнего уровня (мкс, только с importtime - он сам замедляет импорт)
+    и полное время процесса вместе со стартом интерпретатора (с).
+    """
+    env = os.environ | {'PYTHONPATH': os.pathsep.join(filter(None, (str(ROOT), os.environ.get('PYTHONPATH'))))}
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, *(('-X', 'importtime') if importtime else ()), '-c', ENTRY],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - started
+
+    # Первая строка: финализаторы при выходе еще могут писать в stdout.
+    entry = float(process.stdout.splitlines()[0])
+    packages: dict[str, int] = collections.Counter()
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line.removeprefix('import time:').split('|')
+        name = name.strip()
+        packages[name.split('.')[0]] += int(self_us)
+    return entry, packages, wall
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--top', type=int, default=10, help='Сколько самых тяжелых пакетов показать.')
+    parser.add_argument('--budget', type=float, default=BUDGET_MS, help='Бюджет на старт, мс.')
+    args = parser.parse_args()
+
+    # Первый прогон прогревает кэш байткода и файловой системы и не учитывается.
+    _, packages, _ = start_main(importtime=True)
+    runs = [start_main() for _ in range(args.repeat)]
+    entry_ms = statistics.median(run[0] for run in runs) * 1000
+    wall_ms = statistics.median(run[2] for run in runs) * 1000
+
+    print(f'import main + use case: {entry_ms:.1f} ms (median of {args.repeat}), process wall: {wall_ms:.1f} ms')
+    print(f'{"package":>24} | {"self ms":>8}')
+    for package, self_us in packages.most_common(args.top):
+        print(f'{package:>24} | {self_us / 1000:>8.1f}')
+
+    failures = []
+    if entry_ms > args.budget:
+        failures.append(f'startup {entry_ms:.1f} ms is over the {args.budget:.0f} ms budget')
+    if eager := [module for module in LAZY_MODULES if module in packages]:
+        failures.append(f'modules that must be imported lazily were imported at startup: {eager}')
+    for failure in failures:
+        print(f'FAIL: {failure}', file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
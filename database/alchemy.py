@@ -1,7 +1,11 @@
+import contextlib
+import time
+import zlib
 from contextlib import aclosing, asynccontextmanager
 from typing import AsyncGenerator
 
 import pydantic_core
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import (
     AsyncConnection,
     AsyncEngine,
@@ -9,12 +13,65 @@ from sqlalchemy.ext.asyncio import (
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from settings import settings
+from utils.metrics import metrics
 from utils.singletone import ModuleSingletonAssigner
+from utils.weakref import Finalizable
 
 
-class Database:
+# Снимок пула на момент экспорта метрик, см. Database.export_pool_metrics.
+DB_POOL_CHECKED_OUT = metrics.gauge('db_pool_checked_out', 'Соединения пула БД, выданные сессиям.')
+DB_POOL_OVERFLOW = metrics.gauge('db_pool_overflow', 'Соединения сверх pool_size (отрицательное - пул еще не заполнен).')
+DB_POOL_WAITS = metrics.gauge('db_pool_waits', 'Сколько раз с начала работы процесса ждали соединение пула БД.')
+DB_POOL_WAIT_SECONDS = metrics.gauge('db_pool_wait_seconds', 'Ожидание соединения пула БД с начала работы процесса: total/max.')
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул, который считает сколько раз и сколько времени ждали соединение (включая открытие нового).
+    """
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.wait_count += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    for pragma in (
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA mmap_size={settings.sqlite_mmap_size}',
+        f'PRAGMA cache_size={settings.sqlite_cache_size}',
+        f'PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}',
+    ):
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def _crc32(value: str | None) -> int | None:
+    return None if value is None else zlib.crc32(value.encode())
+
+
+def _register_sqlite_functions(dbapi_connection, connection_record) -> None:
+    # crc32 для шардирования таргетов в запросах, см. utils.sharding.shard_of.
+    dbapi_connection.create_function('crc32', 1, _crc32, deterministic=True)
+
+
+class Database(Finalizable):
     _sessionmaker_kwargs = dict(
         expire_on_commit=False,
         join_transaction_mode='create_savepoint',
@@ -23,6 +80,7 @@ class Database:
         self._kwargs = kwargs
         self.connection = connection
         self._maker: async_sessionmaker | None = None
+        self._engine: AsyncEngine | None = None
 
     def __new__(cls, **kwargs) -> 'Database':
         if not hasattr(cls, 'instance'):
@@ -32,22 +90,31 @@ class Database:
 
     @property
     def engine(self) -> AsyncEngine:
-        engine = create_async_engine(
-            **dict(
-                url=settings.db_addr,
-                execution_options={},
-                insertmanyvalues_page_size=100,
-                json_deserializer=pydantic_core.from_json,
-                json_serializer=pydantic_core.to_json,
-                echo=True,
-                max_overflow=10,
-                pool_pre_ping=True,
-                pool_timeout=5,
-                pool_size=5,
-                pool_use_lifo=True,
-            ) | self._kwargs,
-        )
-        return engine
+        """
+        Движок создается один раз при первом обращении и живет до dispose(),
+        чтобы все сессии работали через один пул соединений.
+        """
+        if self._engine is None:
+            self._engine = create_async_engine(
+                **dict(
+                    url=settings.db_addr,
+                    execution_options={},
+                    insertmanyvalues_page_size=100,
+                    json_deserializer=pydantic_core.from_json,
+                    json_serializer=pydantic_core.to_json,
+                    echo=settings.db_echo,
+                    poolclass=TimedAsyncAdaptedQueuePool,
+                    max_overflow=10,
+                    pool_pre_ping=True,
+                    pool_timeout=5,
+                    pool_size=5,
+                    pool_use_lifo=True,
+                ) | self._kwargs,
+            )
+            if self._engine.dialect.name == 'sqlite':
+                event.listen(self._engine.sync_engine, 'connect', _set_sqlite_pragmas)
+                event.listen(self._engine.sync_engine, 'connect', _register_sqlite_functions)
+        return self._engine
 
     @property
     def async_sessionmaker(self) -> async_sessionmaker:
@@ -63,7 +130,45 @@ class Database:
         async with aclosing(self.async_sessionmaker()) as async_session:
                 yield async_session
 
+    def pool_status(self) -> dict[str, int | float]:
+        if self._engine is None:
+            return {}
+        pool = self._engine.pool
+        status = {}
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            status |= dict(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+            )
+        if isinstance(pool, TimedAsyncAdaptedQueuePool):
+            status |= dict(
+                wait_count=pool.wait_count,
+                wait_time_total=pool.wait_time_total,
+                wait_time_max=pool.wait_time_max,
+            )
+        return status
+
+    def export_pool_metrics(self) -> None:
+        status = self.pool_status()
+        if 'checked_out' in status:
+            DB_POOL_CHECKED_OUT.set(status['checked_out'])
+            DB_POOL_OVERFLOW.set(status['overflow'])
+        if 'wait_count' in status:
+            DB_POOL_WAITS.set(status['wait_count'])
+            DB_POOL_WAIT_SECONDS.set(status['wait_time_total'], stat='total')
+            DB_POOL_WAIT_SECONDS.set(status['wait_time_max'], stat='max')
+
+    async def dispose(self) -> None:
+        if self._engine is not None:
+            engine, self._engine, self._maker = self._engine, None, None
+            await engine.dispose()
+
+    async def _finalize(self) -> None:
+        with contextlib.suppress(Exception):
+            await self.dispose()
+
 
 db: Database
 ModuleSingletonAssigner(Database, 'db').assign()
-
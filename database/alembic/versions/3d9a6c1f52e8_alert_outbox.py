@@ -0,0 +1,46 @@
+"""Alert outbox
+
+Revision ID: 3d9a6c1f52e8
+Revises: 8b2e5d07c4a1
+Create Date: 2026-10-18 14:21:07.204519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9a6c1f52e8'
+down_revision: Union[str, Sequence[str], None] = '8b2e5d07c4a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('alert_outbox',
+    sa.Column('id', sa.Integer(), nullable=False, comment='id.'),
+    sa.Column('price_id', sa.Integer(), nullable=False, comment='Сработавший таргет. Таргет срабатывает один раз, поэтому и оповещение одно.'),
+    sa.Column('ticker', sa.String(), nullable=False, comment='Тикер.'),
+    sa.Column('standard_name', sa.String(), nullable=False, comment='Стандартное название монеты.'),
+    sa.Column('target', sa.Numeric(), nullable=False, comment='Таргет цены.'),
+    sa.Column('movement_direction', sa.Enum('DOWN', 'UP', name='cryptopricemovementdirection'), nullable=False, comment='Направление движения цены.'),
+    sa.Column('current', sa.Numeric(), nullable=False, comment='Цена, на которой таргет сработал.'),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=False, comment='Время создания.'),
+    sa.Column('attempts', sa.Integer(), server_default=sa.text('0'), nullable=False, comment='Сколько отправок не удалось.'),
+    sa.Column('next_attempt_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=False, comment='Не раньше какого времени отправлять (UTC).'),
+    sa.Column('sent_at', sa.DateTime(), nullable=True, comment='Время отправки, NULL - еще не отправлено.'),
+    sa.Column('last_error', sa.String(), nullable=True, comment='Ошибка последней неудачной отправки.'),
+    sa.ForeignKeyConstraint(['price_id'], ['cryptoprice.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('price_id')
+    )
+    op.create_index('alert_outbox_pending_ix', 'alert_outbox', ['next_attempt_at'], unique=False, sqlite_where=sa.text('sent_at IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('alert_outbox_pending_ix', table_name='alert_outbox', sqlite_where=sa.text('sent_at IS NULL'))
+    op.drop_table('alert_outbox')
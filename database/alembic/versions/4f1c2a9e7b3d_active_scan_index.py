@@ -0,0 +1,43 @@
+"""Active scan index
+
+Revision ID: 4f1c2a9e7b3d
+Revises: dc72b926645b
+Create Date: 2026-10-18 09:10:12.417305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f1c2a9e7b3d'
+down_revision: Union[str, Sequence[str], None] = 'dc72b926645b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'active_scan_ix',
+        'cryptoprice',
+        [
+            'updated_at',
+            sa.text('abs(target - last_saved)'),
+            'standard_name',
+            'target',
+            'movement_direction',
+            'last_saved',
+            'is_active',
+            'ticker',
+        ],
+        unique=False,
+        sqlite_where=sa.text('is_active = 1'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('active_scan_ix', table_name='cryptoprice', sqlite_where=sa.text('is_active = 1'))
@@ -0,0 +1,38 @@
+"""Candle open/close tick times
+
+Revision ID: 6e0b7d94a3c2
+Revises: 3d9a6c1f52e8
+Create Date: 2026-10-18 16:05:12.418730
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e0b7d94a3c2'
+down_revision: Union[str, Sequence[str], None] = '3d9a6c1f52e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('price_candle') as batch_op:
+        batch_op.add_column(sa.Column('first_ts', sa.DateTime(), nullable=True, comment='Время тика open, UTC.'))
+        batch_op.add_column(sa.Column('last_ts', sa.DateTime(), nullable=True, comment='Время тика close, UTC.'))
+    # Время тиков уже свернутых свечей неизвестно: начало интервала - любой досливаемый тик не раньше его,
+    # поэтому такие свечи примут close от него, как и до этой миграции.
+    op.execute('UPDATE price_candle SET first_ts = start, last_ts = start')
+    with op.batch_alter_table('price_candle') as batch_op:
+        batch_op.alter_column('first_ts', existing_type=sa.DateTime(), nullable=False)
+        batch_op.alter_column('last_ts', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('price_candle') as batch_op:
+        batch_op.drop_column('last_ts')
+        batch_op.drop_column('first_ts')
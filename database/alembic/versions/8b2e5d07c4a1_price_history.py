@@ -0,0 +1,51 @@
+"""Price history
+
+Revision ID: 8b2e5d07c4a1
+Revises: 4f1c2a9e7b3d
+Create Date: 2026-10-18 10:02:41.538114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2e5d07c4a1'
+down_revision: Union[str, Sequence[str], None] = '4f1c2a9e7b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('price_tick',
+    sa.Column('id', sa.Integer(), nullable=False, comment='id.'),
+    sa.Column('standard_name', sa.String(), nullable=False, comment='Стандартное название монеты.'),
+    sa.Column('ts', sa.DateTime(), nullable=False, comment='Время получения цены, UTC.'),
+    sa.Column('price', sa.Numeric(), nullable=False, comment='Цена.'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('price_tick_name_ts_ix', 'price_tick', ['standard_name', 'ts'], unique=False)
+    op.create_index('price_tick_ts_ix', 'price_tick', ['ts'], unique=False)
+    op.create_table('price_candle',
+    sa.Column('id', sa.Integer(), nullable=False, comment='id.'),
+    sa.Column('standard_name', sa.String(), nullable=False, comment='Стандартное название монеты.'),
+    sa.Column('start', sa.DateTime(), nullable=False, comment='Начало интервала свечи, UTC.'),
+    sa.Column('open', sa.Numeric(), nullable=False, comment='Первая цена интервала.'),
+    sa.Column('high', sa.Numeric(), nullable=False, comment='Максимальная цена интервала.'),
+    sa.Column('low', sa.Numeric(), nullable=False, comment='Минимальная цена интервала.'),
+    sa.Column('close', sa.Numeric(), nullable=False, comment='Последняя цена интервала.'),
+    sa.Column('samples', sa.Integer(), nullable=False, comment='Сколько тиков свернуто в свечу.'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('standard_name', 'start', name='price_candle_name_start_uq')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('price_candle')
+    op.drop_index('price_tick_ts_ix', table_name='price_tick')
+    op.drop_index('price_tick_name_ts_ix', table_name='price_tick')
+    op.drop_table('price_tick')
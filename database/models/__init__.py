@@ -1,3 +1,4 @@
 from .crypto_price import *
+from .price_tick import *
+from .alert_outbox import *
 from .base import *
-
@@ -0,0 +1,110 @@
+import datetime
+import decimal
+
+from sqlalchemy import ForeignKey, Index, Row, func, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from database.models.base import ORMBase
+from domain.alert_outbox_repository import OutboxAlert
+from domain.price import CryptoPrice, CryptoPriceMovementDirection
+
+__all__ = (
+    'AlertOutboxORM',
+)
+
+
+class AlertOutboxORM(ORMBase):
+    """
+    Transactional outbox оповещений: строка пишется в той же транзакции, что и is_active = False таргета,
+    поэтому оповещение не теряется, даже если процесс упадет до отправки.
+    """
+    __tablename__ = 'alert_outbox'
+
+    id: Mapped[int] = mapped_column(
+        primary_key=True,
+        comment='id.',
+        nullable=False,
+    )
+    price_id: Mapped[int] = mapped_column(
+        ForeignKey('cryptoprice.id', ondelete='CASCADE'),
+        unique=True,
+        comment='Сработавший таргет. Таргет срабатывает один раз, поэтому и оповещение одно.',
+        nullable=False,
+    )
+    ticker: Mapped[str] = mapped_column(
+        comment='Тикер.',
+        nullable=False,
+    )
+    standard_name: Mapped[str] = mapped_column(
+        comment='Стандартное название монеты.',
+        nullable=False,
+    )
+    target: Mapped[decimal.Decimal] = mapped_column(
+        comment='Таргет цены.',
+        nullable=False,
+    )
+    movement_direction: Mapped[CryptoPriceMovementDirection] = mapped_column(
+        comment='Направление движения цены.',
+        nullable=False,
+    )
+    current: Mapped[decimal.Decimal] = mapped_column(
+        comment='Цена, на которой таргет сработал.',
+        nullable=False,
+    )
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        server_default=func.Now(),
+        nullable=False,
+        comment='Время создания.',
+    )
+    attempts: Mapped[int] = mapped_column(
+        server_default=text('0'),
+        nullable=False,
+        comment='Сколько отправок не удалось.',
+    )
+    next_attempt_at: Mapped[datetime.datetime] = mapped_column(
+        server_default=func.Now(),
+        nullable=False,
+        comment='Не раньше какого времени отправлять (UTC).',
+    )
+    sent_at: Mapped[datetime.datetime | None] = mapped_column(
+        comment='Время отправки, NULL - еще не отправлено.',
+    )
+    last_error: Mapped[str | None] = mapped_column(
+        comment='Ошибка последней неудачной отправки.',
+    )
+
+    __table_args__ = (
+        # Отправитель читает только неотправленные строки по времени повтора.
+        Index('alert_outbox_pending_ix', 'next_attempt_at', sqlite_where=text('sent_at IS NULL')),
+    )
+
+    @staticmethod
+    def values_from_dto(price: CryptoPrice) -> dict:
+        return dict(
+            price_id=price.id,
+            ticker=price.ticker,
+            standard_name=price.standard_name,
+            target=price.target,
+            movement_direction=price.movement_direction,
+            current=price.current,
+        )
+
+    @staticmethod
+    def from_row(row: Row) -> OutboxAlert:
+        """
+        Строка SQLAlertOutboxRepository.claim: id, attempts, затем поля CryptoPrice.
+        """
+        alert_id, attempts, price_id, ticker, standard_name, target, movement_direction, current = row
+        return OutboxAlert(
+            id=alert_id,
+            attempts=attempts,
+            price=CryptoPrice(
+                ticker=ticker,
+                standard_name=standard_name,
+                target=target,
+                movement_direction=movement_direction,
+                id=price_id,
+                current=current,
+                is_active=False,
+            ),
+        )
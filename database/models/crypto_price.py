@@ -1,7 +1,8 @@
 import datetime
 import decimal
+import sys
 
-from sqlalchemy import CheckConstraint, FetchedValue, Index, func, text, true
+from sqlalchemy import CheckConstraint, FetchedValue, Index, Row, func, text, true
 from sqlalchemy.orm import Mapped, mapped_column
 
 from database.models.base import ORMBase
@@ -71,7 +72,16 @@ class CryptoPriceORM(ORMBase):
         return f'{self.target} for {self.ticker}'
 
     @staticmethod
-    def to_dto(price: 'CryptoPriceORM') -> CryptoPrice:
+    def from_row(row: Row) -> CryptoPrice:
+        """
+        Строка SQLPriceRepository._stream_query (колонки в порядке полей CryptoPrice) -> CryptoPrice.
+        standard_name интернируем: монет на порядки меньше, чем таргетов.
+        """
+        ticker, standard_name, *rest = row
+        return CryptoPrice(ticker, sys.intern(standard_name), *rest)
+
+    @staticmethod
+    def to_dto(price: 'CryptoPriceORM | Row') -> CryptoPrice:
         return CryptoPrice(
             id=price.id,
             standard_name=price.standard_name,
@@ -83,6 +93,21 @@ class CryptoPriceORM(ORMBase):
             ticker=price.ticker,
         )
 
+    @staticmethod
+    def values_from_dto(price: 'CryptoPrice') -> dict:
+        """
+        Значения колонок для bulk insert/upsert, те же что и в from_dto, но без ORM объекта.
+        """
+        return dict(
+            id=price.id,
+            standard_name=price.standard_name,
+            target=price.target,
+            movement_direction=price.movement_direction,
+            last_saved=price.current,
+            is_active=price.is_active,
+            ticker=price.ticker,
+        )
+
     @classmethod
     def from_dto(cls, price: 'CryptoPrice') -> 'CryptoPriceORM':
         return cls(
@@ -95,3 +120,20 @@ class CryptoPriceORM(ORMBase):
             ticker=price.ticker,
             updated_at=func.NOW(),
         )
+
+
+# Покрывающий частичный индекс под выборку активных таргетов в SQLPriceRepository: порядок
+# совпадает с ORDER BY, поэтому SQLite читает индекс без временного B-tree для сортировки.
+# Условие именно is_active = 1: с "= True" планировщик SQLite не сопоставляет его с запросом.
+Index(
+    'active_scan_ix',
+    CryptoPriceORM.updated_at,
+    func.abs(CryptoPriceORM.target - CryptoPriceORM.last_saved),
+    CryptoPriceORM.standard_name,
+    CryptoPriceORM.target,
+    CryptoPriceORM.movement_direction,
+    CryptoPriceORM.last_saved,
+    CryptoPriceORM.is_active,
+    CryptoPriceORM.ticker,
+    sqlite_where=text('is_active = 1'),
+)
@@ -0,0 +1,102 @@
+import datetime
+import decimal
+
+from sqlalchemy import Index, Row, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from database.models.base import ORMBase
+from domain.price_history_repository import PriceCandle, PriceTick
+
+__all__ = (
+    'PriceTickORM',
+    'PriceCandleORM',
+)
+
+
+class PriceTickORM(ORMBase):
+    """
+    Сырые тики: одна строка на монету за запуск. Только INSERT, потом свертка в price_candle и DELETE.
+    """
+    __tablename__ = 'price_tick'
+
+    id: Mapped[int] = mapped_column(
+        primary_key=True,
+        comment='id.',
+        nullable=False,
+    )
+    standard_name: Mapped[str] = mapped_column(
+        comment='Стандартное название монеты.',
+        nullable=False,
+    )
+    ts: Mapped[datetime.datetime] = mapped_column(
+        comment='Время получения цены, UTC.',
+        nullable=False,
+    )
+    price: Mapped[decimal.Decimal] = mapped_column(
+        comment='Цена.',
+        nullable=False,
+    )
+
+    __table_args__ = (
+        Index('price_tick_name_ts_ix', 'standard_name', 'ts'),
+        # Для свертки и удаления по сроку хранения по всем монетам сразу.
+        Index('price_tick_ts_ix', 'ts'),
+    )
+
+    @staticmethod
+    def values_from_dto(tick: PriceTick) -> dict:
+        return dict(standard_name=tick.standard_name, ts=tick.ts, price=tick.price)
+
+    @staticmethod
+    def from_row(row: Row) -> PriceTick:
+        return PriceTick(*row)
+
+
+class PriceCandleORM(ORMBase):
+    """
+    OHLC свечи, в которые сворачиваются тики старше срока хранения сырых данных.
+    """
+    __tablename__ = 'price_candle'
+
+    id: Mapped[int] = mapped_column(
+        primary_key=True,
+        comment='id.',
+        nullable=False,
+    )
+    standard_name: Mapped[str] = mapped_column(
+        comment='Стандартное название монеты.',
+        nullable=False,
+    )
+    start: Mapped[datetime.datetime] = mapped_column(
+        comment='Начало интервала свечи, UTC.',
+        nullable=False,
+    )
+    open: Mapped[decimal.Decimal] = mapped_column(nullable=False, comment='Первая цена интервала.')
+    high: Mapped[decimal.Decimal] = mapped_column(nullable=False, comment='Максимальная цена интервала.')
+    low: Mapped[decimal.Decimal] = mapped_column(nullable=False, comment='Минимальная цена интервала.')
+    close: Mapped[decimal.Decimal] = mapped_column(nullable=False, comment='Последняя цена интервала.')
+    samples: Mapped[int] = mapped_column(nullable=False, comment='Сколько тиков свернуто в свечу.')
+    first_ts: Mapped[datetime.datetime] = mapped_column(nullable=False, comment='Время тика open, UTC.')
+    last_ts: Mapped[datetime.datetime] = mapped_column(nullable=False, comment='Время тика close, UTC.')
+
+    __table_args__ = (
+        UniqueConstraint('standard_name', 'start', name='price_candle_name_start_uq'),
+    )
+
+    @staticmethod
+    def values_from_dto(candle: PriceCandle) -> dict:
+        return dict(
+            standard_name=candle.standard_name,
+            start=candle.start,
+            open=candle.open,
+            high=candle.high,
+            low=candle.low,
+            close=candle.close,
+            samples=candle.samples,
+            first_ts=candle.first_ts,
+            last_ts=candle.last_ts,
+        )
+
+    @staticmethod
+    def from_row(row: Row) -> PriceCandle:
+        return PriceCandle(*row)
@@ -0,0 +1,68 @@
+import abc
+import dataclasses
+import datetime
+import enum
+from typing import Sequence, TYPE_CHECKING
+
+from utils.enums import CaseInsensitiveMixin
+
+if TYPE_CHECKING:
+    from .price import CryptoPrice
+
+__all__ = (
+    'AlertDelivery',
+    'OutboxAlert',
+    'AlertOutboxRepository',
+)
+
+
+class AlertDelivery(CaseInsensitiveMixin, enum.StrEnum):
+    # Оповещения пишутся в outbox в одной транзакции с деактивацией таргета, отправляются отдельно.
+    OUTBOX = 'outbox'
+    # Оповещения отправляются прямо из пайплайна проверки.
+    INLINE = 'inline'
+
+
+@dataclasses.dataclass(slots=True)
+class OutboxAlert:
+    """
+    Запись outbox: сработавший таргет (price.current - цена срабатывания) и сколько раз его уже не удалось отправить.
+    """
+    id: int
+    attempts: int
+    price: 'CryptoPrice'
+
+
+class AlertOutboxRepository(abc.ABC):
+    """
+    Очередь неотправленных оповещений. Запись в нее делает CryptoPriceRepository.add_many
+    в транзакции сохранения таргетов, здесь - только разбор.
+    Доставка at-least-once: упавший после отправки, но до mark_sent процесс отправит пачку повторно.
+    """
+    @abc.abstractmethod
+    async def claim(
+            self,
+            now: datetime.datetime,
+            limit: int,
+            lease_until: datetime.datetime,
+    ) -> list[OutboxAlert]:
+        """
+        Берет до limit неотправленных оповещений, время повтора которых наступило, и откладывает
+        их повтор до lease_until, чтобы параллельный отправитель не взял ту же пачку.
+        """
+
+    @abc.abstractmethod
+    async def mark_sent(self, ids: Sequence[int], now: datetime.datetime) -> None:
+        pass
+
+    @abc.abstractmethod
+    async def mark_failed(self, ids: Sequence[int], error: str, retry_at: datetime.datetime) -> None:
+        """
+        Увеличивает счетчик попыток и назначает следующую на retry_at.
+        """
+
+    @abc.abstractmethod
+    async def purge(self, sent_before: datetime.datetime) -> int:
+        """
+        Удаляет оповещения, отправленные раньше sent_before. Возвращает, сколько удалено.
+        """
@@ -15,14 +15,24 @@ class CryptoPriceMovementDirection(CaseInsensitiveMixin, enum.StrEnum):
     UP = 'up'
 
 
-@dataclasses.dataclass
+# Общие на все новые таргеты значения last_saved.
+_INFINITY = decimal.Decimal('Infinity')
+_NEGATIVE_INFINITY = decimal.Decimal('-Infinity')
+
+
+@dataclasses.dataclass(slots=True)
 class CryptoPrice:
+    """
+    slots: в памяти одновременно живут сотни тысяч таргетов, __dict__ на каждый - лишние ~100 байт.
+    Порядок полей совпадает с колонками SQLPriceRepository._stream_query, строку можно распаковать в конструктор.
+    """
     ticker: str
     standard_name: str
     target: decimal.Decimal
     movement_direction: CryptoPriceMovementDirection
     id: int | None = None
-    last_saved: dataclasses.InitVar[decimal.Decimal | None] = dataclasses.field(default=None)
+    # None у нового таргета: в __post_init__ заменяется на бесконечность против направления движения.
+    last_saved: decimal.Decimal | None = None
     current:decimal.Decimal | None = None
     is_active: bool = True
 
@@ -36,14 +46,12 @@ class CryptoPrice:
     ) -> Awaitable['CryptoPrice']:
         return await sourcing_repository.fetch(self)
 
-    def __post_init__(self, last_saved) -> None:
-        if last_saved is None:
+    def __post_init__(self) -> None:
+        if self.last_saved is None:
             if self.movement_direction == CryptoPriceMovementDirection.DOWN:
-                self.last_saved: decimal.Decimal = decimal.Decimal('Infinity')
+                self.last_saved = _INFINITY
             else:
-                self.last_saved: decimal.Decimal  = decimal.Decimal('-Infinity')
-        else:
-            self.last_saved: decimal.Decimal  = last_saved
+                self.last_saved = _NEGATIVE_INFINITY
 
     def __repr__(self):
         return f'Price ("{self.ticker.upper()}")'
@@ -0,0 +1,73 @@
+import abc
+import dataclasses
+import datetime
+import decimal
+from typing import Iterable, Mapping
+
+
+
+@dataclasses.dataclass
+class PriceCacheStats:
+    hits: int = 0
+    misses: int = 0
+    expirations: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclasses.dataclass(slots=True)
+class ChunkValidators:
+    """
+    ETag/Last-Modified последнего ответа api на пачку монет и цены из него - на случай 304.
+    """
+    etag: str | None
+    last_modified: str | None
+    prices: dict[str, decimal.Decimal]
+
+    @property
+    def headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag is not None:
+            headers['if-none-match'] = self.etag
+        if self.last_modified is not None:
+            headers['if-modified-since'] = self.last_modified
+        return headers
+
+
+class PriceCacheRepository(abc.ABC):
+    """
+    Кэш текущих цен монет по standard_name. У каждой записи свой TTL, размер кэша ограничен,
+    при переполнении вытесняются давно не читанные записи (LRU).
+    """
+    stats: PriceCacheStats
+
+    @abc.abstractmethod
+    async def get_many(self, names: Iterable[str]) -> dict[str, decimal.Decimal]:
+        pass
+
+    @abc.abstractmethod
+    async def set_many(
+            self,
+            prices: Mapping[str, decimal.Decimal],
+            ttl: datetime.timedelta | None = None,
+    ) -> None:
+        """
+        ttl=None - TTL кэша по умолчанию. Нулевой ttl - тоже TTL, запись сразу устаревает.
+        """
+
+    @abc.abstractmethod
+    async def get_validators(self, key: str) -> ChunkValidators | None:
+        """
+        Валидаторы пачки для условного запроса. Живут столько же, сколько сам кэш, и без TTL:
+        устаревшие сервер отвергнет полным ответом.
+        """
+
+    @abc.abstractmethod
+    async def set_validators(self, key: str, validators: ChunkValidators | None) -> None:
+        """
+        None - забыть валидаторы пачки.
+        """
@@ -1,5 +1,5 @@
 import abc
-from typing import AsyncIterator, Awaitable, TYPE_CHECKING
+from typing import AsyncIterator, Awaitable, ClassVar, Sequence, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from .price import CryptoPrice
@@ -7,10 +7,38 @@ if TYPE_CHECKING:
 
 
 class CryptoPriceRepository(abc.ABC):
+    # Пишет ли add_many оповещения в outbox той же транзакцией. Без этого alert_delivery = outbox невозможен,
+    # CheckTargetsUseCase проверяет это при создании, а не на первом сработавшем таргете.
+    supports_alert_outbox: ClassVar[bool] = False
+
     @abc.abstractmethod
     async def add(self, price: 'CryptoPrice') -> 'CryptoPrice':
         pass
 
+    async def add_many(
+            self,
+            prices: Sequence['CryptoPrice'],
+            alerts: Sequence['CryptoPrice'] = (),
+    ) -> Sequence['CryptoPrice']:
+        """
+        alerts - сработавшие таргеты из prices, оповещения о которых нужно поставить в outbox
+        в той же транзакции, что и их сохранение.
+        """
+        if alerts:
+            raise NotImplementedError(f'{type(self).__name__} does not support the alert outbox.')
+        for price in prices:
+            await self.add(price)
+        return prices
+
+    async def active_coins(self) -> dict[str, str]:
+        """
+        standard_name -> ticker всех монет с активными таргетами (тикер любого из таргетов монеты).
+        """
+        coins = {}
+        async for price in self:
+            coins.setdefault(price.standard_name, price.ticker)
+        return coins
+
     @abc.abstractmethod
     async def __aiter__(self) -> AsyncIterator['CryptoPrice']:
         pass
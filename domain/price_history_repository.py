@@ -0,0 +1,101 @@
+import abc
+import dataclasses
+import datetime
+import decimal
+from typing import AsyncIterator, Sequence
+
+__all__ = (
+    'PriceTick',
+    'PriceCandle',
+    'CompactionResult',
+    'PriceHistoryRepository',
+    'bucket_start',
+)
+
+
+@dataclasses.dataclass(slots=True)
+class PriceTick:
+    """
+    Цена монеты в момент ts (UTC, без tzinfo - как CURRENT_TIMESTAMP в SQLite).
+    """
+    standard_name: str
+    ts: datetime.datetime
+    price: decimal.Decimal
+
+
+@dataclasses.dataclass(slots=True)
+class PriceCandle:
+    """
+    OHLC свеча монеты за интервал [start, start + resolution).
+    first_ts и last_ts - время тиков, давших open и close: по ним тик, досливаемый в свечу
+    после свертки, меняет open или close, только если он раньше или позже уже свернутых.
+    """
+    standard_name: str
+    start: datetime.datetime
+    open: decimal.Decimal
+    high: decimal.Decimal
+    low: decimal.Decimal
+    close: decimal.Decimal
+    samples: int
+    first_ts: datetime.datetime
+    last_ts: datetime.datetime
+
+
+@dataclasses.dataclass(frozen=True)
+class CompactionResult:
+    candles: int = 0
+    ticks_deleted: int = 0
+    candles_deleted: int = 0
+
+
+class PriceHistoryRepository(abc.ABC):
+    """
+    Append-only история цен: сырые тики и свечи, в которые тики сворачиваются после срока хранения.
+    """
+    @abc.abstractmethod
+    async def add_many(self, ticks: Sequence[PriceTick]) -> Sequence[PriceTick]:
+        pass
+
+    @abc.abstractmethod
+    def ticks(
+            self,
+            standard_name: str,
+            start: datetime.datetime,
+            end: datetime.datetime,
+    ) -> AsyncIterator[PriceTick]:
+        """
+        Тики монеты за [start, end) по возрастанию ts, стримом.
+        """
+
+    @abc.abstractmethod
+    def candles(
+            self,
+            standard_name: str,
+            start: datetime.datetime,
+            end: datetime.datetime,
+    ) -> AsyncIterator[PriceCandle]:
+        """
+        Свечи монеты с началом в [start, end) по возрастанию, стримом.
+        """
+
+    @abc.abstractmethod
+    async def compact(
+            self,
+            cutoff: datetime.datetime,
+            resolution: datetime.timedelta,
+            candles_cutoff: datetime.datetime | None = None,
+    ) -> CompactionResult:
+        """
+        Сворачивает тики старше cutoff в свечи размером resolution и удаляет их.
+        Свечи старше candles_cutoff, если он задан, удаляются.
+        """
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def bucket_start(ts: datetime.datetime, resolution: datetime.timedelta) -> datetime.datetime:
+    """
+    Начало интервала resolution, в который попадает ts. Интервалы выровнены от эпохи.
+    """
+    return ts - (ts - _EPOCH) % resolution
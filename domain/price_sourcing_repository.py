@@ -1,5 +1,5 @@
 import abc
-from typing import Awaitable, TYPE_CHECKING
+from typing import Awaitable, Sequence, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from .price import CryptoPrice
@@ -10,3 +10,12 @@ class CryptoPriceSourcingRepository(abc.ABC):
     @abc.abstractmethod
     async def fetch(self, price: 'CryptoPrice') -> Awaitable['CryptoPrice']:
         pass
+
+    async def fetch_many(self, prices: Sequence['CryptoPrice']) -> Sequence['CryptoPrice']:
+        """
+        Заполняет current у всех переданных цен. Реализации, которые умеют получать несколько
+        монет за один запрос, должны переопределить этот метод.
+        """
+        for price in prices:
+            await self.fetch(price)
+        return prices
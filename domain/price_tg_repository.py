@@ -1,5 +1,5 @@
 import abc
-from typing import Awaitable, TYPE_CHECKING
+from typing import Awaitable, Sequence, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from .price import CryptoPrice
@@ -10,3 +10,11 @@ class PriceMessangerRepository(abc.ABC):
     @abc.abstractmethod
     async def send(self, price: 'CryptoPrice') -> Awaitable['CryptoPrice']:
         pass
+
+    async def send_many(self, prices: Sequence['CryptoPrice']) -> None:
+        """
+        Отправляет пачку оповещений. Реализации, которые умеют объединять их в одно сообщение,
+        должны переопределить этот метод.
+        """
+        for price in prices:
+            await self.send(price)
@@ -0,0 +1,116 @@
+import bisect
+import dataclasses
+import decimal
+import heapq
+import operator
+from typing import Iterable, TYPE_CHECKING
+
+from .price import CryptoPriceMovementDirection
+
+if TYPE_CHECKING:
+    from .price import CryptoPrice
+
+__all__ = (
+    'TriggerIndex',
+)
+
+
+@dataclasses.dataclass
+class _Bucket:
+    """
+    Таргеты одной монеты и одного направления с общим last_saved, отсортированные по target.
+    """
+    targets: list[decimal.Decimal] = dataclasses.field(default_factory=list)
+    prices: list['CryptoPrice'] = dataclasses.field(default_factory=list)
+
+    def add(self, price: 'CryptoPrice') -> None:
+        position = bisect.bisect_right(self.targets, price.target)
+        self.targets.insert(position, price.target)
+        self.prices.insert(position, price)
+
+    def pop_range(self, lo: int, hi: int) -> list['CryptoPrice']:
+        if hi <= lo:
+            return []
+        crossed = self.prices[lo:hi]
+        del self.targets[lo:hi]
+        del self.prices[lo:hi]
+        return crossed
+
+
+class TriggerIndex:
+    """
+    Индекс таргетов по standard_name: для каждого направления отсортированные массивы target,
+    сгруппированные по last_saved. Тик цены находит все пересеченные таргеты двумя bisect
+    на группу - O(log n + k) вместо проверки каждого таргета:
+        UP:   last_saved <  target <= current
+        DOWN: current    <= target <  last_saved
+
+    trigger() убирает сработавшие таргеты и переносит остальные на новую цену, поэтому
+    один индекс можно держать между тиками потокового источника. Групп с разным last_saved
+    больше одной бывает только до первого тика (новые таргеты, пропуски), после него они сливаются.
+    """
+    def __init__(self, prices: Iterable['CryptoPrice'] = ()) -> None:
+        # standard_name -> направление -> last_saved -> группа.
+        self._index: dict[str, dict[CryptoPriceMovementDirection, dict[decimal.Decimal, _Bucket]]] = {}
+        self.add_many(prices)
+
+    def add(self, price: 'CryptoPrice') -> None:
+        by_direction = self._index.setdefault(price.standard_name, {})
+        buckets = by_direction.setdefault(price.movement_direction, {})
+        buckets.setdefault(price.last_saved, _Bucket()).add(price)
+
+    def add_many(self, prices: Iterable['CryptoPrice']) -> None:
+        for price in sorted(prices, key=operator.attrgetter('target')):
+            self.add(price)
+
+    def __len__(self) -> int:
+        return sum(
+            len(bucket.prices)
+            for by_direction in self._index.values()
+            for buckets in by_direction.values()
+            for bucket in buckets.values()
+        )
+
+    def __contains__(self, standard_name: str) -> bool:
+        return standard_name in self._index
+
+    def trigger(self, standard_name: str, current: decimal.Decimal) -> list['CryptoPrice']:
+        """
+        Возвращает таргеты монеты, пересеченные движением цены от last_saved к current,
+        помечает их неактивными и убирает из индекса.
+        """
+        triggered = []
+        for direction, buckets in self._index.get(standard_name, {}).items():
+            for last_saved, bucket in buckets.items():
+                if direction == CryptoPriceMovementDirection.UP:
+                    lo = bisect.bisect_right(bucket.targets, last_saved)
+                    hi = bisect.bisect_right(bucket.targets, current)
+                else:
+                    lo = bisect.bisect_left(bucket.targets, current)
+                    hi = bisect.bisect_left(bucket.targets, last_saved)
+                triggered.extend(bucket.pop_range(lo, hi))
+            self._rebase(buckets, current)
+        for price in triggered:
+            price.is_active = False
+        return triggered
+
+    @staticmethod
+    def _rebase(buckets: dict[decimal.Decimal, _Bucket], current: decimal.Decimal) -> None:
+        """
+        После тика last_saved всех оставшихся таргетов - это current: группы сливаются в одну.
+        """
+        remaining = [bucket for bucket in buckets.values() if bucket.prices]
+        buckets.clear()
+        if not remaining:
+            return
+        if len(remaining) == 1:
+            buckets[current] = remaining[0]
+            return
+        merged = _Bucket()
+        for target, price in heapq.merge(
+                *(zip(bucket.targets, bucket.prices) for bucket in remaining),
+                key=operator.itemgetter(0),
+        ):
+            merged.targets.append(target)
+            merged.prices.append(price)
+        buckets[current] = merged
@@ -0,0 +1,125 @@
+import decimal
+import enum
+import functools
+import importlib.util
+from types import ModuleType
+from typing import Iterable, Mapping, TYPE_CHECKING
+
+from utils.enums import CaseInsensitiveMixin
+from .price import CryptoPriceMovementDirection
+
+if TYPE_CHECKING:
+    from .price import CryptoPrice
+
+__all__ = (
+    'TriggerBackend',
+    'InexactPriceError',
+    'VectorTriggerEvaluator',
+    'NUMPY_AVAILABLE',
+)
+
+# numpy - необязательная зависимость (extra "vector"). Импортируется при первой векторной проверке,
+# а не при импорте модуля: с backend index он не нужен вовсе.
+NUMPY_AVAILABLE = importlib.util.find_spec('numpy') is not None
+
+
+@functools.cache
+def _numpy() -> ModuleType:
+    import numpy
+    return numpy
+
+# Значения last_saved +-Infinity у новых таргетов.
+_INT64_MAX = 2 ** 63 - 1
+_INT64_MIN = -2 ** 63
+
+
+class TriggerBackend(CaseInsensitiveMixin, enum.StrEnum):
+    # Decimal сравнения через TriggerIndex.
+    INDEX = 'index'
+    # Векторные сравнения по колонкам numpy в целых числах с фиксированным масштабом.
+    NUMPY = 'numpy'
+
+
+class InexactPriceError(ValueError):
+    """
+    Цена не представима в int64 с заданным масштабом без потери точности.
+    """
+
+
+def to_scaled(value: decimal.Decimal, scale: int) -> int:
+    """
+    Decimal -> целое число единиц 10^-scale. Округления нет: если значение не помещается в scale
+    знаков после запятой или в int64, бросает InexactPriceError, и пачку проверяем в Decimal.
+    """
+    if value.is_infinite():
+        return _INT64_MAX if value > 0 else _INT64_MIN
+    scaled = value.scaleb(scale)
+    if scaled != scaled.to_integral_value():
+        raise InexactPriceError(f'{value} has more than {scale} decimal places.')
+    integer = int(scaled)
+    if not _INT64_MIN < integer < _INT64_MAX:
+        raise InexactPriceError(f'{value} does not fit into int64 with scale {scale}.')
+    return integer
+
+
+class VectorTriggerEvaluator:
+    """
+    Колоночное представление активных таргетов: target, last_saved, направление и индекс монеты
+    в массивах int64/bool. Тик по нескольким монетам проверяется одним набором векторных сравнений
+        UP:   last_saved <  target <= current
+        DOWN: current    <= target <  last_saved
+
+    Политика точности - без допусков: цены хранятся как целые числа единиц 10^-scale,
+    поэтому сравнения точные и совпадают с Decimal. Значения, которые так не представить,
+    дают InexactPriceError при построении или при тике, а не округляются.
+    """
+    def __init__(self, prices: Iterable['CryptoPrice'], scale: int) -> None:
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError('numpy is not installed.')
+        np = _numpy()
+        self.scale = scale
+        self.prices = list(prices)
+        self.coins: dict[str, int] = {}
+        size = len(self.prices)
+        self.coin = np.fromiter(
+            (self.coins.setdefault(price.standard_name, len(self.coins)) for price in self.prices),
+            dtype=np.int64, count=size,
+        )
+        self.target = np.fromiter((to_scaled(price.target, scale) for price in self.prices), dtype=np.int64, count=size)
+        self.last_saved = np.fromiter(
+            (to_scaled(price.last_saved, scale) for price in self.prices), dtype=np.int64, count=size,
+        )
+        self.up = np.fromiter(
+            (price.movement_direction == CryptoPriceMovementDirection.UP for price in self.prices),
+            dtype=bool, count=size,
+        )
+        self.active = np.ones(size, dtype=bool)
+
+    def __len__(self) -> int:
+        return int(self.active.sum())
+
+    def trigger(self, currents: Mapping[str, decimal.Decimal]) -> list['CryptoPrice']:
+        """
+        Таргеты, пересеченные движением цен currents (standard_name -> цена). Сработавшие
+        помечаются неактивными, last_saved остальных таргетов этих монет переносится на новую цену.
+        """
+        np = _numpy()
+        current_by_coin = np.zeros(len(self.coins), dtype=np.int64)
+        has_current = np.zeros(len(self.coins), dtype=bool)
+        for name, current in currents.items():
+            if (coin := self.coins.get(name)) is not None:
+                current_by_coin[coin] = to_scaled(current, self.scale)
+                has_current[coin] = True
+
+        ticked = has_current[self.coin] & self.active
+        current = current_by_coin[self.coin]
+        up_hit = self.up & (self.last_saved < self.target) & (self.target <= current)
+        down_hit = ~self.up & (current <= self.target) & (self.target < self.last_saved)
+        hit = ticked & (up_hit | down_hit)
+
+        self.active &= ~hit
+        np.copyto(self.last_saved, current, where=ticked)
+        triggered = [self.prices[position] for position in np.flatnonzero(hit)]
+        for price in triggered:
+            price.is_active = False
+        return triggered
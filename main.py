@@ -1,7 +1,63 @@
 #!/usr/bin/env -S uv run --script
+import argparse
+from typing import TYPE_CHECKING
+
 import anyio
 
+from domain.alert_outbox_repository import AlertDelivery
+from settings import settings
 from usecases.check_targets import CheckTargetsUseCase
 
+if TYPE_CHECKING:
+    from usecases.sharded_check_targets import ShardedCheckTargetsUseCase
+
+
+def build_use_case(shards: int) -> 'CheckTargetsUseCase | ShardedCheckTargetsUseCase':
+    if shards > 1:
+        from usecases.sharded_check_targets import ShardedCheckTargetsUseCase
+        return ShardedCheckTargetsUseCase(shards)
+    return CheckTargetsUseCase()
+
+
+async def check_and_send(use_case) -> None:
+    """
+    Разовый запуск: проверка, затем разбор outbox, даже если проверка упала - записанное ею уже закоммичено.
+    """
+    try:
+        await use_case.execute()
+    finally:
+        if AlertDelivery(settings.alert_delivery) is AlertDelivery.OUTBOX:
+            from usecases.send_alerts import SendAlertsUseCase
+            await SendAlertsUseCase().execute()
+
+
 if __name__ == '__main__':
-    anyio.run(CheckTargetsUseCase().execute)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--daemon',
+        action='store_true',
+        help='Не завершаться после проверки, а повторять ее раз в settings.price_update_interval.',
+    )
+    parser.add_argument(
+        '--compact-history',
+        action='store_true',
+        help='Свернуть старые тики истории цен в свечи и выйти (для запуска по cron).',
+    )
+    parser.add_argument(
+        '--shards',
+        type=int,
+        default=settings.check_shards,
+        help='Разделить таргеты между столькими процессами (по crc32 standard_name).',
+    )
+    args = parser.parse_args()
+
+    use_case = build_use_case(args.shards)
+
+    if args.compact_history:
+        from usecases.compact_price_history import CompactPriceHistoryUseCase
+        anyio.run(CompactPriceHistoryUseCase().execute)
+    elif args.daemon:
+        from usecases.daemon import CheckTargetsDaemonUseCase
+        anyio.run(CheckTargetsDaemonUseCase(use_case=use_case).execute)
+    else:
+        anyio.run(check_and_send, use_case)
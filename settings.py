@@ -1,18 +1,149 @@
 import dataclasses
 import datetime
+import os
+from typing import Mapping
 
 from utils.singletone import ModuleSingletonAssigner
 
 __all__ = (
     'settings',
+    'StageSettings',
 )
 
+
+@dataclasses.dataclass(frozen=True)
+class StageSettings:
+    workers: int = 3
+    capacity: int = 3
+
+
 @dataclasses.dataclass(frozen=True)
 class ProjectSettings:
     db_addr: str = 'sqlite+aiosqlite:///crypto_price_db.db'
+    # PRAGMA для каждого нового SQLite соединения.
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64_000
+    sqlite_busy_timeout_ms: int = 5_000
     api_base_url: str = 'https://api.coingecko.com/api/v3/simple/price'
     vs_currency: str = 'usd'
     price_update_interval: datetime.timedelta = datetime.timedelta(minutes=10)
+    # Сколько идентификаторов монет отправляем в одном запросе simple/price.
+    api_ids_per_request: int = 250
+    # Средняя заполненность стабильной пачки монет: запас под разброс хэша, чтобы пачки не переполнялись
+    # и не дробились на лишние запросы. Состав пачки не меняется от запуска к запуску, пока не меняется число пачек.
+    api_chunk_fill: float = 0.8
+    api_max_url_length: int = 2000
+    api_max_connections: int = 10
+    api_transport_retries: int = 2
+    # Лимитер запросов к api (запросов в секунду). Стартовая скорость подстраивается под реальный лимит.
+    api_rate_limit: float = 0.25
+    api_rate_limit_min: float = 0.02
+    api_rate_limit_max: float = 2.0
+    api_rate_limit_step: float = 0.05
+    api_rate_burst: int = 3
+    # Сколько раз пробуем пачку, получившую 429, прежде чем отложить ее до следующего запуска.
+    api_max_attempts: int = 5
+    api_backoff_base: datetime.timedelta = datetime.timedelta(seconds=1)
+    api_backoff_max: datetime.timedelta = datetime.timedelta(seconds=60)
+    # Сколько пачек помним с ETag/Last-Modified для условных запросов. Валидаторы хранятся в кэше цен:
+    # с price_cache_backend = sqlite они переживают перезапуск, с memory условные запросы бывают только в daemon режиме.
+    api_validators_maxsize: int = 1_024
+    # Источник цен: http - опрос simple/price CoinGecko, cryptocompare - опрос pricemulti,
+    # ws - постоянное подключение к потоку тикеров биржи, composite - несколько источников из price_sources.
+    price_source: str = 'http'
+    # Поток mini ticker всех пар Binance. Символ пары = ticker таргета + ws_quote_asset.
+    ws_url: str = 'wss://stream.binance.com:9443/ws/!miniTicker@arr'
+    ws_quote_asset: str = 'USDT'
+    # Цена из потока старше этого считается неизвестной.
+    ws_price_max_age: datetime.timedelta = datetime.timedelta(minutes=1)
+    # Сколько первая проверка ждет первого снимка цен после подключения.
+    ws_ready_timeout: datetime.timedelta = datetime.timedelta(seconds=10)
+    # pricemulti CryptoCompare - второй http источник; цены адресуются ticker таргета.
+    cryptocompare_url: str = 'https://min-api.cryptocompare.com/data/pricemulti'
+    cryptocompare_api_key: str | None = None
+    # Источники для price_source='composite' по порядку предпочтения до накопления статистики.
+    price_sources: tuple[str, ...] = ('http', 'cryptocompare')
+    # first - первый полный ответ, median - медиана ответов price_median_quorum источников.
+    price_aggregation: str = 'first'
+    price_median_quorum: int = 2
+    # Если источник не ответил за это время, параллельно запрашиваем следующий (hedged request).
+    price_hedge_delay: datetime.timedelta = datetime.timedelta(milliseconds=500)
+    # Вес нового замера в скользящих средних задержки и доли ошибок источника.
+    price_source_ewma_alpha: float = 0.2
+    # Источник с долей ошибок выше этой считается нездоровым и спрашивается последним.
+    price_source_max_error_rate: float = 0.5
+    # Кэш цен: memory - только на время запуска, sqlite - переживает перезапуски по таймеру.
+    price_cache_backend: str = 'sqlite'
+    price_cache_path: str = 'price_cache.db'
+    price_cache_maxsize: int = 10_000
+    # Доля от price_update_interval, в течение которой цена из кэша считается актуальной.
+    price_cache_ttl_ratio: float = 0.9
+    # Сколько строк таргетов читаем из БД за раз при стриминге.
+    db_read_batch_size: int = 1_000
+    # Сколько daemon режим ждет завершения текущего запуска после SIGTERM.
+    daemon_shutdown_grace: datetime.timedelta = datetime.timedelta(seconds=30)
+    # Буферизованная запись в БД: сброс по размеру пачки или по истечении интервала.
+    db_write_batch_size: int = 100
+    db_write_flush_interval: datetime.timedelta = datetime.timedelta(seconds=1)
+    # Параллелизм и емкость входного канала для каждой стадии пайплайна CheckTargetsUseCase.
+    pipeline_stages: Mapping[str, StageSettings] = dataclasses.field(default_factory=lambda: {
+        'fetch_web_data': StageSettings(),
+        'save_data_in_db': StageSettings(),
+        'send_to_tg': StageSettings(workers=1),
+        'save_ticks': StageSettings(workers=1),
+    })
+    # Автоподстройка числа fetch воркеров по глубине очереди и задержке в пределах лимита api.
+    fetch_autoscale: bool = False
+    fetch_workers_min: int = 1
+    fetch_workers_max: int = 16
+    autoscale_interval: datetime.timedelta = datetime.timedelta(milliseconds=500)
+    # История цен: один тик на монету за запуск. Сырые тики храним price_tick_retention, затем
+    # сворачиваем в свечи price_candle_resolution. price_candle_retention None - свечи храним бессрочно.
+    price_tick_retention: datetime.timedelta = datetime.timedelta(days=7)
+    price_candle_resolution: datetime.timedelta = datetime.timedelta(hours=1)
+    price_candle_retention: datetime.timedelta | None = None
+    # Как часто daemon режим запускает свертку истории.
+    price_history_compact_interval: datetime.timedelta = datetime.timedelta(hours=1)
+    # Проверка таргетов: index - Decimal и bisect индекс, numpy - векторно по колонкам
+    # (нужен extra "vector"). В numpy цены - целые числа единиц 10^-trigger_price_scale,
+    # пачка с ценами точнее этого масштаба проверяется в Decimal.
+    trigger_backend: str = 'index'
+    trigger_price_scale: int = 8
+    # Сколько процессов делят таргеты по crc32(standard_name). 1 - весь пайплайн в текущем процессе.
+    # Каждый процесс берет 1/check_shards лимита api; Telegram оповещения отправляет координатор.
+    check_shards: int = 1
+    # Куда выгружать метрики в конце каждого запуска: текстовый формат Prometheus
+    # (каталог textfile collector node_exporter) и/или JSON сводка. None - не выгружать.
+    metrics_textfile_path: str | None = None
+    metrics_json_path: str | None = None
+    # Сколько оповещений максимум склеиваем в одну отправку в Telegram.
+    tg_batch_size: int = 50
+    # Доставка оповещений: outbox - пайплайн пишет их в alert_outbox той же транзакцией, что и деактивацию
+    # таргета, а отдельный отправитель разбирает таблицу пачками с повторами; inline - отправка из пайплайна.
+    alert_delivery: str = 'outbox'
+    # Как часто daemon режим разбирает outbox.
+    alert_outbox_interval: datetime.timedelta = datetime.timedelta(seconds=5)
+    # На сколько отправитель откладывает взятую пачку, чтобы ее не взял параллельный отправитель.
+    alert_outbox_lease: datetime.timedelta = datetime.timedelta(minutes=2)
+    # Повтор неудачной отправки через base * 2^attempts с jitter, но не позже чем через max.
+    alert_retry_backoff_base: datetime.timedelta = datetime.timedelta(seconds=5)
+    alert_retry_backoff_max: datetime.timedelta = datetime.timedelta(minutes=30)
+    # Сколько хранить уже отправленные оповещения, потом они удаляются из outbox.
+    alert_outbox_retention: datetime.timedelta = datetime.timedelta(days=7)
+    # Профиль логирования: 'dev' - цветная консоль, 'prod' - JSON через неблокирующую очередь.
+    # dev и DEBUG включаются только явно, через CRYPTO_PRICES_LOG_PROFILE / CRYPTO_PRICES_LOG_LEVEL:
+    # DEBUG пишет строки на каждую пачку пайплайна.
+    log_profile: str = dataclasses.field(default_factory=lambda: os.environ.get('CRYPTO_PRICES_LOG_PROFILE', 'prod'))
+    log_level: str = dataclasses.field(default_factory=lambda: os.environ.get('CRYPTO_PRICES_LOG_LEVEL', 'INFO'))
+    # Логировать ли каждый SQL запрос SQLAlchemy.
+    db_echo: bool = False
+
+    def stage(self, name: str) -> StageSettings:
+        return self.pipeline_stages.get(name, StageSettings())
+
+    @property
+    def price_cache_ttl(self) -> datetime.timedelta:
+        return self.price_update_interval * self.price_cache_ttl_ratio
 
 
 settings: ProjectSettings
@@ -1,138 +1,269 @@
-import asyncio
-from typing import AsyncGenerator, TYPE_CHECKING
+import datetime
+import decimal
+import time
+from typing import Mapping, Sequence, TYPE_CHECKING
 
-from adapter import PriceTGRepository
-from adapter.http_price_sourcing_repository import repository as http_repository
+import anyio
+from anyio.streams.memory import MemoryObjectSendStream
+
+from adapter.price_source import build_price_source
+from adapter.sql_price_history_repository import SQLPriceHistoryRepository
+from adapter.price_tg_repository import repository as tg_repository
 from adapter.sql_price_repository import SQLPriceRepository
-from domain.price import CryptoPrice
+from database.alchemy import db
+from domain.alert_outbox_repository import AlertDelivery
+from domain.price import CryptoPrice, CryptoPriceMovementDirection
+from domain.price_history_repository import PriceTick
+from domain.trigger_index import TriggerIndex
+from domain.trigger_vector import InexactPriceError, NUMPY_AVAILABLE, TriggerBackend, VectorTriggerEvaluator
+from settings import StageSettings, settings
 from utils.logging import log
+from utils.metrics import metrics
+from utils.pipeline import AutoscalePolicy, PipelineStage
+from utils.sharding import stable_chunks
 
 if TYPE_CHECKING:
     from domain.price_sourcing_repository import CryptoPriceSourcingRepository
     from domain.price_db_repository import CryptoPriceRepository
     from domain.price_tg_repository import PriceMessangerRepository
+    from domain.price_history_repository import PriceHistoryRepository
 
+TRIGGER_CHECK_SECONDS = metrics.histogram('trigger_check_seconds', 'Время проверки таргетов одной пачки.')
+TARGETS = metrics.counter('targets_total', 'Обработанные таргеты по результату.')
+RUN_SECONDS = metrics.gauge('run_duration_seconds', 'Длительность последнего запуска пайплайна.')
 
-QUEUE_MAXSIZE = 3
 
 class CheckTargetsUseCase:
+    """
+    Пайплайн: main_producer -> fetch (получение цен и проверка таргетов) -> save (запись в БД)
+                                     |-> telegram (оповещения о сработавших таргетах)
+                                     \\-> ticks (история цен, один тик на монету за запуск).
+    Цены всех монет запуска main_producer получает до чтения таргетов: одним запросом на стабильную
+    пачку монет, а не на каждую пачку таргетов, в которой те же монеты встречаются снова.
+    Стадии работают в одной task group: ошибка в любой из них отменяет остальные.
+    При alert_delivery = outbox стадии telegram нет: оповещения пишутся в alert_outbox той же транзакцией,
+    что и деактивация таргета, а отправляет их SendAlertsUseCase.
+    """
     def __init__(
             self,
-            targets_repo:'CryptoPriceSourcingRepository' = http_repository,
+            targets_repo: 'CryptoPriceSourcingRepository | None' = None,
             sql_repo: 'CryptoPriceRepository'=SQLPriceRepository(),
-            tg_repo: 'PriceMessangerRepository' = PriceTGRepository(),
+            tg_repo: 'PriceMessangerRepository' = tg_repository,
+            history_repo: 'PriceHistoryRepository | None' = None,
+            stages: Mapping[str, StageSettings] | None = None,
+            fetch_autoscale: bool = settings.fetch_autoscale,
+            trigger_backend: str = settings.trigger_backend,
+            alert_delivery: str = settings.alert_delivery,
     ) -> None:
-        self.targets_repo  = targets_repo
+        self.targets_repo = targets_repo if targets_repo is not None else build_price_source()
         self.sql_repo = sql_repo
         self.tg_repo = tg_repo
+        self.history_repo = history_repo if history_repo is not None else SQLPriceHistoryRepository()
+        # Монеты, тик которых уже записан в этом запуске: одна монета бывает в нескольких пачках.
+        self._ticked: set[str] = set()
+        # Цены монет этого запуска, None - источник монету не знает.
+        self._prices: dict[str, decimal.Decimal | None] = {}
+        # Настройки отдельных стадий поверх settings.pipeline_stages.
+        self.stages = stages or {}
+        self.fetch_autoscale = fetch_autoscale
+        self.trigger_backend = TriggerBackend(trigger_backend)
+        if self.trigger_backend is TriggerBackend.NUMPY and not NUMPY_AVAILABLE:
+            log.warning('numpy is not installed, falling back to the index trigger backend.')
+            self.trigger_backend = TriggerBackend.INDEX
+        self.alert_delivery = AlertDelivery(alert_delivery)
+        if self.alert_delivery is AlertDelivery.OUTBOX and not self.sql_repo.supports_alert_outbox:
+            raise ValueError(
+                f'{type(self.sql_repo).__name__} does not support the alert outbox, use alert_delivery="inline".'
+            )
+
+    def _stage_settings(self, name: str) -> StageSettings:
+        return self.stages.get(name) or settings.stage(name)
+
+    def _fetch_autoscale_policy(self) -> AutoscalePolicy | None:
+        if not self.fetch_autoscale:
+            return None
+        rate_limiter = getattr(self.targets_repo, 'rate_limiter', None)
+        return AutoscalePolicy(
+            min_workers=settings.fetch_workers_min,
+            max_workers=settings.fetch_workers_max,
+            interval=settings.autoscale_interval,
+            can_grow=(lambda: not rate_limiter.saturated) if rate_limiter is not None else None,
+        )
+
+    async def send_to_tg(self, prices: list[CryptoPrice]) -> None:
+        # Все, что уже накопилось в канале, уходит одним сообщением.
+        await self.tg_repo.send_many(prices)
+        await log.ainfo(f'Sent {len(prices)} prices to telegram bot.', prices=prices)
+
+    async def check_trigger(self, price: CryptoPrice) -> bool:
+        return bool(await self.check_triggers([price]))
+
+    def _evaluate_triggers(self, prices: list[CryptoPrice]) -> list[CryptoPrice]:
+        currents = {price.standard_name: price.current for price in prices}
+        if self.trigger_backend is TriggerBackend.NUMPY:
+            try:
+                return VectorTriggerEvaluator(prices, settings.trigger_price_scale).trigger(currents)
+            except InexactPriceError:
+                # Цены с большим числом знаков, чем trigger_price_scale, проверяем точно в Decimal.
+                pass
+        index = TriggerIndex(prices)
+        return [price for name, current in currents.items() for price in index.trigger(name, current)]
 
-        self.fetch_queue = asyncio.Queue(QUEUE_MAXSIZE)
-        self.telegram_queue = asyncio.Queue(QUEUE_MAXSIZE)
-        self.save_db_queue = asyncio.Queue(QUEUE_MAXSIZE)
-
-        self.main_end_event = asyncio.Event()
-        self.fetch_end_event = asyncio.Event()
-        self.save_in_db_end_event = asyncio.Event()
-        self.tg_end_event = asyncio.Event()
-
-    async def send_to_tg_consumer(self, _id: int) -> None:
-        async for price in self._get_price_from_queue(
-                self.telegram_queue,
-                self.fetch_end_event,
-                self.tg_end_event ,
-                _id,
-                name='send_to_tg_consumer',
-        ):
-            await self.tg_repo.send(price)
-            await log.ainfo(f'Sending price {price} to telegram bot.', id=_id, price=price)
-            self.telegram_queue.task_done()
-
-    async def check_trigger(self, price: CryptoPrice) -> None:
-        last_saved = price.last_saved
-        current = price.current
-        target =  price.target
-        if ((price.movement_direction.DOWN and (last_saved > target >= current)) or
-                (price.movement_direction.UP and (last_saved < target <= current))):
-            price.is_active = False
-            await self.telegram_queue.put(price)
+    async def check_triggers(self, prices: Sequence[CryptoPrice]) -> list[CryptoPrice]:
+        """
+        Все таргеты пачки, пересеченные движением цены от last_saved к current.
+        Одна цена на монету проверяется сразу по всем ее таргетам: по индексу или векторно.
+        """
+        triggered = self._evaluate_triggers([price for price in prices if price.current])
+        for price in triggered:
             await log.ainfo(
                 f'check_trigger:: Condition has triggered.',
                 target=price.target, price=price.current, price_id=price.id
             )
+        return triggered
 
-    @staticmethod
-    async def _get_price_from_queue(
-            queue: asyncio.Queue,
-            prev_event: asyncio.Event,
-            current_event: asyncio.Event,
-            _id: int,
-            name: str,
-    ) -> AsyncGenerator[CryptoPrice, None]:
+    async def fetch_web_data(
+            self,
+            prices: Sequence[CryptoPrice],
+            save_db_send: MemoryObjectSendStream[CryptoPrice],
+            tick_send: MemoryObjectSendStream[PriceTick],
+            telegram_send: MemoryObjectSendStream[CryptoPrice] | None = None,
+    ) -> None:
+        if unknown := [price for price in prices if price.standard_name not in self._prices]:
+            # Таргеты монет, появившихся после prefetch_prices.
+            await self.targets_repo.fetch_many(unknown)
+            self._prices.update((price.standard_name, price.current) for price in unknown)
+        for price in prices:
+            price.current = self._prices[price.standard_name]
+        fetched_at = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+        for price in prices:
+            if price.current and price.standard_name not in self._ticked:
+                self._ticked.add(price.standard_name)
+                await tick_send.send(PriceTick(price.standard_name, fetched_at, price.current))
+        with TRIGGER_CHECK_SECONDS.time():
+            triggered = await self.check_triggers(prices)
+        if telegram_send is not None:
+            for price in triggered:
+                await telegram_send.send(price)
+        for price in prices:
+            if price.current:
+                await save_db_send.send(price)
+            else:
+                TARGETS.inc(result='skipped')
+        TARGETS.inc(len(triggered), result='triggered')
+
+    async def save_data_in_db(self, prices: list[CryptoPrice]) -> None:
+        if self.alert_delivery is AlertDelivery.OUTBOX:
+            # Сработавшие таргеты - те, что проверка деактивировала.
+            await self.sql_repo.add_many(prices, alerts=[price for price in prices if not price.is_active])
+        else:
+            await self.sql_repo.add_many(prices)
+        TARGETS.inc(len(prices), result='saved')
+        await log.adebug(f'Saved {len(prices)} prices in db.')
+
+    async def save_ticks(self, ticks: list[PriceTick]) -> None:
+        await self.history_repo.add_many(ticks)
+
+    async def prefetch_prices(self) -> None:
         """
-        1) С тайм-аутом в 1 сек мы пытаемся получить задачу из очереди пока продюсер не закончил работу.
-        2) Как только продюсер закончил работу prev_event.is_set() == True, мы переходим в режим get_nowait,
-        в котором мы просто берем все задачи из очереди пока они не закончатся.
-        3) Задачи заканчиваются и мы устанавливаем эвент текущего контекста в True, что говорит о том что везде,
-        где этот консьюмер является продюсером мы сигнализируем об окончании работы.
-        4) Завершаем работу консьюмера.
+        Цены всех монет с активными таргетами, по одному запросу источника на пачку из stable_chunks.
+        Состав пачек повторяется от запуска к запуску, поэтому повторяются и url запросов, а с ними
+        и условные запросы по ETag/Last-Modified.
+        """
+        coins = await self.sql_repo.active_coins()
+        chunks = stable_chunks(coins, settings.api_ids_per_request, settings.api_chunk_fill)
+
+        async def fetch(names: list[str]) -> None:
+            # Источнику нужны только тикер и название, таргет и направление ни на что не влияют.
+            prices = [
+                CryptoPrice(coins[name], name, decimal.Decimal(0), CryptoPriceMovementDirection.UP)
+                for name in names
+            ]
+            await self.targets_repo.fetch_many(prices)
+            self._prices.update((price.standard_name, price.current) for price in prices)
+
+        async with anyio.create_task_group() as tg:
+            for chunk in chunks:
+                tg.start_soon(fetch, chunk)
+        await log.adebug(f'Prefetched prices of {len(coins)} coins in {len(chunks)} chunks.')
+
+    async def main_producer(self, fetch_send: MemoryObjectSendStream[list[CryptoPrice]]) -> None:
+        """
+        Собирает цены в пачки, в которых не больше settings.api_ids_per_request разных монет:
+        монеты, которых не было в prefetch_prices, пачка получает одним http запросом.
         """
-        local_log = log.bind(id=_id, name=name)
-        while True:
-            try:
-                if not prev_event.is_set():
-                    price = await asyncio.wait_for(queue.get(), timeout=1.0)
-                else:
-                    price = queue.get_nowait()
-                await local_log.ainfo(f'Got price {price}')
-            except asyncio.TimeoutError:
-                continue
-            except (asyncio.CancelledError, asyncio.queues.QueueEmpty):
-                await local_log.ainfo('Exiting, all done.')
-                if current_event is not None:
-                    current_event.set()
-                break
-            else:
-                yield price
-
-    async def fetch_web_data_consumer(self, _id: int) -> None:
-        async for price in self._get_price_from_queue(
-                self.fetch_queue,
-                self.main_end_event,
-                self.fetch_end_event,
-                _id,
-                name='fetch_web_data_consumer',
-        ):
-            await http_repository.fetch(price)
-            if price.current:
-                await self.check_trigger(price)
-                await self.save_db_queue.put(price)
-            self.fetch_queue.task_done()
-
-    async def save_data_in_db_consumer(self, _id: int) -> None:
-        async for price in self._get_price_from_queue(
-                self.save_db_queue,
-                self.fetch_end_event,
-                self.save_in_db_end_event,
-                _id,
-                name='save_data_in_db_consumer',
-        ):
-            await self.sql_repo.add(price)
-            await log.ainfo(f'Saved price {price} in db.', consumer='save_data_in_db_consumer', id=_id)
-            self.save_db_queue.task_done()
-
-
-    async def main_producer(self) -> None:
         log_local = log.bind(producer='main_producer')
-        async for price in self.sql_repo:
-            await self.fetch_queue.put(price)
-            await log_local.ainfo(f'Put price {price} in queue.')
-        self.main_end_event.set()
-        await log_local.ainfo(f'Set main event. All done!')
+        async with fetch_send:
+            await self.prefetch_prices()
+            batch, names = [], set()
+            async for price in self.sql_repo:
+                if price.standard_name not in names and len(names) >= settings.api_ids_per_request:
+                    await fetch_send.send(batch)
+                    await log_local.adebug(f'Put batch of {len(batch)} prices in queue.')
+                    batch, names = [], set()
+                batch.append(price)
+                names.add(price.standard_name)
+            if batch:
+                await fetch_send.send(batch)
+                await log_local.adebug(f'Put batch of {len(batch)} prices in queue.')
+        await log_local.ainfo(f'All done!')
 
     async def execute(self) -> None:
-        await asyncio.gather(
-            self.main_producer(),
-            *[self.fetch_web_data_consumer(_id) for _id in range(QUEUE_MAXSIZE)],
-            *[self.save_data_in_db_consumer(_id) for _id in range(QUEUE_MAXSIZE)],
-            *[self.send_to_tg_consumer(_id) for _id in range(1)],
+        fetch_settings = self._stage_settings('fetch_web_data')
+        save_db_settings = self._stage_settings('save_data_in_db')
+        telegram_settings = self._stage_settings('send_to_tg')
+        ticks_settings = self._stage_settings('save_ticks')
+        inline_alerts = self.alert_delivery is AlertDelivery.INLINE
+        fetch_stage = PipelineStage[list[CryptoPrice]](
+            'fetch_web_data',
+            fetch_settings.workers,
+            fetch_settings.capacity,
+            autoscale=self._fetch_autoscale_policy(),
+        )
+        save_db_stage = PipelineStage[CryptoPrice](
+            'save_data_in_db',
+            save_db_settings.workers,
+            save_db_settings.capacity,
+            batch_size=settings.db_write_batch_size,
+            batch_timeout=settings.db_write_flush_interval,
+        )
+        telegram_stage = PipelineStage[CryptoPrice](
+            'send_to_tg',
+            telegram_settings.workers,
+            telegram_settings.capacity,
+            batch_size=settings.tg_batch_size,
         )
+        ticks_stage = PipelineStage[PriceTick](
+            'save_ticks',
+            ticks_settings.workers,
+            ticks_settings.capacity,
+            batch_size=settings.db_write_batch_size,
+            batch_timeout=settings.db_write_flush_interval,
+        )
+        stages = (fetch_stage, save_db_stage, ticks_stage) + ((telegram_stage,) if inline_alerts else ())
+        self._ticked = set()
+        self._prices = {}
+        started = time.perf_counter()
+        try:
+            async with anyio.create_task_group() as tg:
+                save_db_stage.start(tg, self.save_data_in_db)
+                ticks_stage.start(tg, self.save_ticks)
+                if inline_alerts:
+                    telegram_stage.start(tg, self.send_to_tg)
+                    fetch_stage.start(tg, self.fetch_web_data, save_db_stage, ticks_stage, telegram_stage)
+                else:
+                    fetch_stage.start(tg, self.fetch_web_data, save_db_stage, ticks_stage)
+                tg.start_soon(self.main_producer, fetch_stage.sender())
+                for stage in stages:
+                    stage.close()
+        finally:
+            RUN_SECONDS.set(time.perf_counter() - started)
+            self.export_metrics()
+
+    @staticmethod
+    def export_metrics() -> None:
+        db.export_pool_metrics()
+        if settings.metrics_textfile_path:
+            metrics.write_prometheus(settings.metrics_textfile_path)
+        if settings.metrics_json_path:
+            metrics.write_json(settings.metrics_json_path)
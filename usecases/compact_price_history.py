@@ -0,0 +1,35 @@
+import dataclasses
+import datetime
+
+from adapter.sql_price_history_repository import SQLPriceHistoryRepository
+from domain.price_history_repository import CompactionResult, PriceHistoryRepository
+from settings import settings
+from utils.logging import log
+
+
+class CompactPriceHistoryUseCase:
+    """
+    Ретеншн истории цен: сырые тики храним tick_retention, потом сворачиваем в OHLC свечи
+    размером candle_resolution. Свечи старше candle_retention удаляются, None - храним бессрочно.
+    """
+    def __init__(
+            self,
+            history_repo: PriceHistoryRepository | None = None,
+            tick_retention: datetime.timedelta = settings.price_tick_retention,
+            candle_resolution: datetime.timedelta = settings.price_candle_resolution,
+            candle_retention: datetime.timedelta | None = settings.price_candle_retention,
+    ) -> None:
+        self.history_repo = history_repo if history_repo is not None else SQLPriceHistoryRepository()
+        self.tick_retention = tick_retention
+        self.candle_resolution = candle_resolution
+        self.candle_retention = candle_retention
+
+    async def execute(self) -> CompactionResult:
+        now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+        result = await self.history_repo.compact(
+            cutoff=now - self.tick_retention,
+            resolution=self.candle_resolution,
+            candles_cutoff=now - self.candle_retention if self.candle_retention is not None else None,
+        )
+        await log.ainfo('Price history compacted.', **dataclasses.asdict(result))
+        return result
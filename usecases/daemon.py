@@ -0,0 +1,85 @@
+import datetime
+import signal
+
+import anyio
+
+from database.alchemy import db
+from domain.alert_outbox_repository import AlertDelivery
+from settings import settings
+from usecases.check_targets import CheckTargetsUseCase
+from usecases.compact_price_history import CompactPriceHistoryUseCase
+from usecases.send_alerts import SendAlertsUseCase
+from usecases.sharded_check_targets import ShardedCheckTargetsUseCase
+from utils.logging import log
+from utils.scheduler import PeriodicScheduler
+from utils.weakref import Finalizable
+
+
+class CheckTargetsDaemonUseCase:
+    """
+    Долгоживущий режим: http клиент, движок БД и сессия Telegram создаются один раз и переиспользуются
+    между запусками пайплайна раз в settings.price_update_interval. Свертка истории цен идет
+    своим расписанием раз в settings.price_history_compact_interval. При alert_delivery = outbox
+    outbox оповещений разбирается раз в settings.alert_outbox_interval, независимо от проверки цен.
+    Завершается по SIGTERM/SIGINT.
+    """
+    def __init__(
+            self,
+            interval: datetime.timedelta = settings.price_update_interval,
+            use_case: CheckTargetsUseCase | ShardedCheckTargetsUseCase | None = None,
+            compact_interval: datetime.timedelta = settings.price_history_compact_interval,
+            compact_use_case: CompactPriceHistoryUseCase | None = None,
+            alert_delivery: str = settings.alert_delivery,
+            alerts_interval: datetime.timedelta = settings.alert_outbox_interval,
+            alerts_use_case: SendAlertsUseCase | None = None,
+    ) -> None:
+        self.interval = interval
+        self.use_case = use_case if use_case is not None else CheckTargetsUseCase()
+        self.compact_interval = compact_interval
+        self.compact_use_case = compact_use_case if compact_use_case is not None else CompactPriceHistoryUseCase()
+        self.alerts_interval = alerts_interval
+        self.alerts_use_case = None
+        if AlertDelivery(alert_delivery) is AlertDelivery.OUTBOX:
+            self.alerts_use_case = alerts_use_case if alerts_use_case is not None else SendAlertsUseCase()
+
+    @staticmethod
+    async def _stop_on_signal(*schedulers: PeriodicScheduler) -> None:
+        with anyio.open_signal_receiver(signal.SIGTERM, signal.SIGINT) as signals:
+            async for signum in signals:
+                await log.ainfo(f'Got {signal.Signals(signum).name}, shutting down.')
+                for scheduler in schedulers:
+                    scheduler.stop()
+                return
+
+    async def _shutdown(self) -> None:
+        if isinstance(self.use_case, Finalizable):
+            await self.use_case.finalize()
+        repositories = {
+            getattr(use_case, name, None)
+            for use_case in (self.use_case, self.alerts_use_case)
+            for name in ('targets_repo', 'tg_repo')
+        }
+        for repository in repositories:
+            if isinstance(repository, Finalizable):
+                await repository.finalize()
+        await db.dispose()
+
+    async def execute(self) -> None:
+        schedulers = [
+            PeriodicScheduler(self.use_case.execute, self.interval, grace=settings.daemon_shutdown_grace),
+            PeriodicScheduler(self.compact_use_case.execute, self.compact_interval, grace=settings.daemon_shutdown_grace),
+        ]
+        if self.alerts_use_case is not None:
+            schedulers.append(
+                PeriodicScheduler(self.alerts_use_case.execute, self.alerts_interval, grace=settings.daemon_shutdown_grace),
+            )
+        try:
+            async with anyio.create_task_group() as tg:
+                tg.start_soon(self._stop_on_signal, *schedulers)
+                async with anyio.create_task_group() as runners:
+                    for scheduler in schedulers:
+                        runners.start_soon(scheduler.run)
+                tg.cancel_scope.cancel()
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self._shutdown()
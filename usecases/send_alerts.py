@@ -0,0 +1,82 @@
+import datetime
+import random
+
+from adapter.price_tg_repository import repository as tg_repository
+from adapter.sql_alert_outbox_repository import SQLAlertOutboxRepository
+from domain.alert_outbox_repository import AlertOutboxRepository, OutboxAlert
+from domain.price_tg_repository import PriceMessangerRepository
+from settings import settings
+from utils.logging import log
+from utils.metrics import metrics
+
+__all__ = (
+    'SendAlertsUseCase',
+)
+
+OUTBOX_ALERTS = metrics.counter('alert_outbox_total', 'Оповещения из outbox: sent/failed.')
+
+
+class SendAlertsUseCase:
+    """
+    Разбирает outbox оповещений пачками по batch_size, пока есть оповещения, время отправки которых наступило.
+    Пачка, которую не удалось отправить, откладывается с экспоненциальным backoff и jitter, и разбор
+    останавливается до следующего запуска: мессенджер, скорее всего, недоступен и для остальных.
+    После отправки из outbox удаляются оповещения, отправленные раньше, чем retention назад.
+    """
+    def __init__(
+            self,
+            outbox_repo: AlertOutboxRepository | None = None,
+            tg_repo: PriceMessangerRepository = tg_repository,
+            batch_size: int = settings.tg_batch_size,
+            lease: datetime.timedelta = settings.alert_outbox_lease,
+            backoff_base: datetime.timedelta = settings.alert_retry_backoff_base,
+            backoff_max: datetime.timedelta = settings.alert_retry_backoff_max,
+            retention: datetime.timedelta = settings.alert_outbox_retention,
+    ) -> None:
+        self.outbox_repo = outbox_repo if outbox_repo is not None else SQLAlertOutboxRepository()
+        self.tg_repo = tg_repo
+        self.batch_size = batch_size
+        self.lease = lease
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retention = retention
+
+    def retry_delay(self, attempts: int) -> datetime.timedelta:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempts)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def execute(self) -> int:
+        sent = 0
+        while True:
+            now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+            alerts = await self.outbox_repo.claim(now, self.batch_size, now + self.lease)
+            if not alerts:
+                break
+            if not await self._send(alerts, now):
+                break
+            sent += len(alerts)
+        if sent:
+            await log.ainfo(f'Sent {sent} alerts from outbox.')
+            # Отправленные строки копятся только вместе с отправками, поэтому и чистим после них.
+            if purged := await self.outbox_repo.purge(now - self.retention):
+                await log.ainfo(f'Purged {purged} sent alerts from outbox.')
+        return sent
+
+    async def _send(self, alerts: list[OutboxAlert], now: datetime.datetime) -> bool:
+        ids = [alert.id for alert in alerts]
+        try:
+            await self.tg_repo.send_many([alert.price for alert in alerts])
+        except Exception as exc:
+            attempts = max(alert.attempts for alert in alerts) + 1
+            retry_at = now + self.retry_delay(attempts - 1)
+            await self.outbox_repo.mark_failed(ids, repr(exc), retry_at)
+            OUTBOX_ALERTS.inc(len(alerts), result='failed')
+            await log.awarning(
+                f'Failed to send {len(alerts)} alerts, retrying at {retry_at:%Y-%m-%d %H:%M:%S}.',
+                attempts=attempts,
+                error=repr(exc),
+            )
+            return False
+        await self.outbox_repo.mark_sent(ids, now)
+        OUTBOX_ALERTS.inc(len(alerts), result='sent')
+        return True
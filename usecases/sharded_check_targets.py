@@ -0,0 +1,186 @@
+import asyncio
+import concurrent.futures
+import dataclasses
+import multiprocessing
+import time
+from typing import Any, Callable, Sequence, TYPE_CHECKING
+
+import anyio
+import structlog
+
+from adapter.price_source import build_price_source
+from adapter.price_tg_repository import repository as tg_repository
+from adapter.sql_price_repository import SQLPriceRepository
+from domain.price import CryptoPrice
+from domain.price_tg_repository import PriceMessangerRepository
+from settings import settings
+from usecases.check_targets import RUN_SECONDS, CheckTargetsUseCase
+from utils.logging import log
+from utils.metrics import CounterValues, metrics
+from utils.sharding import Shard
+from utils.weakref import Finalizable
+
+if TYPE_CHECKING:
+    from domain.price_sourcing_repository import CryptoPriceSourcingRepository
+
+__all__ = (
+    'ShardResult',
+    'ShardedCheckTargetsUseCase',
+)
+
+SHARD_SECONDS = metrics.gauge('shard_run_seconds', 'Длительность последнего запуска шарда.')
+SHARD_ALERTS = metrics.gauge('shard_alerts', 'Сработавшие таргеты шарда в последнем запуске.')
+
+
+@dataclasses.dataclass
+class ShardResult:
+    shard: int
+    seconds: float
+    alerts: list[CryptoPrice]
+    # Приросты счетчиков метрик воркера за этот запуск.
+    counters: CounterValues
+
+
+class CollectingMessangerRepository(PriceMessangerRepository):
+    """
+    Копит оповещения воркера, чтобы координатор отправил их одной Telegram сессией:
+    файл сессии telethon нельзя открывать из нескольких процессов.
+    """
+    def __init__(self) -> None:
+        self.alerts: list[CryptoPrice] = []
+
+    async def send(self, price: CryptoPrice) -> CryptoPrice:
+        self.alerts.append(price)
+        return price
+
+    async def send_many(self, prices: Sequence[CryptoPrice]) -> None:
+        self.alerts.extend(prices)
+
+
+class _ShardCheckTargetsUseCase(CheckTargetsUseCase):
+    @staticmethod
+    def export_metrics() -> None:
+        # Файлы метрик пишет только координатор, иначе воркеры перезаписывали бы их друг за другом.
+        pass
+
+
+# Свой event loop воркера живет между запусками: http клиент и движок БД - синглтоны процесса,
+# привязанные к этому loop, и переиспользуются, как в daemon режиме.
+_runner: asyncio.Runner | None = None
+
+
+def _share_rate_limits(repository: 'CryptoPriceSourcingRepository', shards: int) -> None:
+    for source in (repository, *getattr(repository, 'sources', {}).values()):
+        if (rate_limiter := getattr(source, 'rate_limiter', None)) is not None:
+            rate_limiter.scale(1 / shards)
+
+
+def _init_worker(shards: int, initializer: Callable[..., Any] | None, initargs: tuple) -> None:
+    global _runner
+    _runner = asyncio.Runner()
+    if initializer is not None:
+        initializer(*initargs)
+    _share_rate_limits(build_price_source(), shards)
+
+
+def run_shard(shard: Shard) -> ShardResult:
+    """
+    Пайплайн по таргетам одного шарда в процессе воркера. Выполняется в пуле процессов.
+    """
+    messenger = CollectingMessangerRepository()
+
+    async def run() -> None:
+        with structlog.contextvars.bound_contextvars(shard=shard.index):
+            await _ShardCheckTargetsUseCase(
+                sql_repo=SQLPriceRepository(shard=shard),
+                tg_repo=messenger,
+            ).execute()
+
+    before = metrics.counter_values()
+    started = time.perf_counter()
+    _runner.run(run())
+    seconds = time.perf_counter() - started
+    counters = {key: value - before.get(key, 0) for key, value in metrics.counter_values().items()}
+    return ShardResult(
+        shard=shard.index,
+        seconds=seconds,
+        alerts=messenger.alerts,
+        counters={key: value for key, value in counters.items() if value},
+    )
+
+
+class ShardedCheckTargetsUseCase(Finalizable):
+    """
+    CheckTargetsUseCase на нескольких ядрах. Активные таргеты делятся на shards частей
+    по crc32(standard_name), каждая часть проверяется полным пайплайном в своем процессе
+    со своим event loop, http клиентом, сессиями БД и долей лимита api. Координатор ждет все шарды,
+    отправляет оповещения одной пачкой и сливает счетчики метрик воркеров в свои.
+
+    SQLite: воркеры пишут в одну БД конкурентно. В WAL читатели не блокируют писателя,
+    а коммиты писателей SQLite сериализует сам - ждущий коммит ждет до sqlite_busy_timeout_ms.
+    Пул процессов (spawn) создается при первом запуске и живет до _finalize, поэтому в daemon режиме
+    воркеры и их соединения переиспользуются между запусками.
+    """
+    def __init__(
+            self,
+            shards: int = settings.check_shards,
+            tg_repo: PriceMessangerRepository = tg_repository,
+            initializer: Callable[..., Any] | None = None,
+            initargs: tuple = (),
+    ) -> None:
+        if shards < 1:
+            raise ValueError('shards must be positive.')
+        self.shards = shards
+        self.tg_repo = tg_repo
+        # Вызывается в каждом воркере один раз перед первым шардом (например, для подмены источника цен).
+        self.initializer = initializer
+        self.initargs = initargs
+        self.last_results: list[ShardResult] = []
+        self._pool: concurrent.futures.ProcessPoolExecutor | None = None
+
+    @property
+    def pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.shards,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.shards, self.initializer, self.initargs),
+            )
+        return self._pool
+
+    async def execute(self) -> None:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            outcomes = await asyncio.gather(
+                *(loop.run_in_executor(self.pool, run_shard, Shard(index, self.shards)) for index in range(self.shards)),
+                return_exceptions=True,
+            )
+            results = [outcome for outcome in outcomes if isinstance(outcome, ShardResult)]
+            errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+            self.last_results = results
+            for result in results:
+                metrics.merge_counters(result.counters)
+                SHARD_SECONDS.set(result.seconds, shard=result.shard)
+                SHARD_ALERTS.set(len(result.alerts), shard=result.shard)
+            # Таргеты успешных шардов уже деактивированы в БД, поэтому их оповещения отправляем
+            # даже если другие шарды упали.
+            if alerts := [alert for result in results for alert in result.alerts]:
+                await self.tg_repo.send_many(alerts)
+            await log.ainfo(
+                f'Checked {self.shards} shards.',
+                alerts=len(alerts),
+                seconds={result.shard: round(result.seconds, 3) for result in results},
+                failed=len(errors),
+            )
+            if errors:
+                raise BaseExceptionGroup('Some shards failed.', errors)
+        finally:
+            RUN_SECONDS.set(time.perf_counter() - started)
+            CheckTargetsUseCase.export_metrics()
+
+    async def _finalize(self) -> None:
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await anyio.to_thread.run_sync(pool.shutdown)
@@ -1,21 +1,102 @@
+import enum
 import logging
+import logging.handlers
+import queue
+import sys
+import weakref
+from typing import Any, Callable
 
 import structlog
 
+from settings import settings
 
-structlog.configure(
-    processors=[
-        structlog.contextvars.merge_contextvars,
-        structlog.processors.add_log_level,
-        structlog.processors.StackInfoRenderer(),
-        structlog.dev.set_exc_info,
-        structlog.processors.TimeStamper(fmt="%Y-%m-%d %H:%M:%S", utc=False),
-        structlog.dev.ConsoleRenderer(colors=True, force_colors=True)
-    ],
-    wrapper_class=structlog.make_filtering_bound_logger(logging.NOTSET),
-    context_class=dict,
-    logger_factory=structlog.PrintLoggerFactory(),
-    cache_logger_on_first_use=False
+__all__ = (
+    'log',
+    'LogProfile',
 )
 
-log = structlog.get_logger()
\ No newline at end of file
+
+class LogProfile(enum.StrEnum):
+    # Цветной вывод в консоль, синхронно. Для локальной разработки.
+    DEV = 'dev'
+    # JSON строки через очередь: форматирование в вызывающем потоке, запись в stdout в отдельном потоке.
+    PROD = 'prod'
+
+
+def _sync_async_methods(wrapper_class: type) -> type:
+    """
+    Асинхронные методы structlog (ainfo и т.д.) по умолчанию гоняют каждый вызов через
+    run_in_executor, чтобы не блокировать цикл записью. Когда запись и так неблокирующая
+    (кладем в очередь), этот переход в пул потоков - чистые накладные расходы,
+    поэтому вызываем синхронный метод напрямую. Отфильтрованные по уровню методы остаются no-op.
+    """
+    def make(name: str):
+        async def method(self, event: str, *args: Any, **kw: Any) -> Any:
+            return getattr(self, name)(event, *args, **kw)
+        return method
+
+    async def alog(self, level: int, event: str, *args: Any, **kw: Any) -> Any:
+        return self.log(level, event, *args, **kw)
+
+    methods = {f'a{name}': make(name) for name in (
+        'debug', 'info', 'warning', 'warn', 'error', 'critical', 'fatal', 'exception',
+    )}
+    return type(f'Sync{wrapper_class.__name__}', (wrapper_class,), methods | {'alog': alog})
+
+
+def _queue_logger_factory() -> Callable[..., logging.Logger]:
+    """
+    Логгер stdlib с QueueHandler: вызывающий код только кладет готовую строку в очередь,
+    вывод делает QueueListener в своем потоке. Очередь дренируется при выходе.
+    """
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    listener.start()
+    # Через weakref.finalize, а не atexit: финализаторы синглтонов (они тоже пишут в лог)
+    # создаются позже и при выходе отрабатывают раньше остановки слушателя.
+    weakref.finalize(listener, listener.stop)
+
+    logger = logging.getLogger('crypto_prices')
+    logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return lambda *_: logger
+
+
+def configure_logging(profile: str = settings.log_profile, level: str = settings.log_level) -> None:
+    min_level = logging.getLevelNamesMapping()[level.upper()]
+    wrapper_class = structlog.make_filtering_bound_logger(min_level)
+
+    if LogProfile(profile) is LogProfile.PROD:
+        processors = [
+            structlog.contextvars.merge_contextvars,
+            structlog.processors.add_log_level,
+            structlog.processors.TimeStamper(fmt='iso', utc=True),
+            structlog.processors.dict_tracebacks,
+            structlog.processors.JSONRenderer(),
+        ]
+        logger_factory = _queue_logger_factory()
+        wrapper_class = _sync_async_methods(wrapper_class)
+    else:
+        processors = [
+            structlog.contextvars.merge_contextvars,
+            structlog.processors.add_log_level,
+            structlog.processors.StackInfoRenderer(),
+            structlog.dev.set_exc_info,
+            structlog.processors.TimeStamper(fmt="%Y-%m-%d %H:%M:%S", utc=False),
+            structlog.dev.ConsoleRenderer(colors=True, force_colors=True)
+        ]
+        logger_factory = structlog.PrintLoggerFactory()
+
+    structlog.configure(
+        processors=processors,
+        wrapper_class=wrapper_class,
+        context_class=dict,
+        logger_factory=logger_factory,
+        cache_logger_on_first_use=True,
+    )
+
+
+configure_logging()
+
+log = structlog.get_logger()
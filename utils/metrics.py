@@ -0,0 +1,185 @@
+import bisect
+import contextlib
+import json
+import os
+import tempfile
+import time
+from typing import Iterator, Mapping
+
+from utils.singletone import ModuleSingletonAssigner
+
+__all__ = (
+    'metrics',
+)
+
+LabelsKey = tuple[tuple[str, str], ...]
+# (имя, описание, метки) -> значение счетчика. Снимок, который можно передать в другой процесс.
+CounterValues = dict[tuple[str, str, LabelsKey], float]
+
+# Границы бакетов по умолчанию для задержек в секундах.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels_key(labels: dict[str, object]) -> LabelsKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _render_labels(key: LabelsKey, extra: tuple[tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ''
+    escaped = (
+        (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _label_suffix(key: LabelsKey) -> str:
+    return ','.join(f'{name}={value}' for name, value in key)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self._values: dict[LabelsKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[tuple[str, LabelsKey, float]]:
+        for key, value in self._values.items():
+            yield self.name, key, value
+
+    def summary(self) -> dict:
+        return {_label_suffix(key): value for key, value in self._values.items()}
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        self._values[_labels_key(labels)] = value
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными бакетами: observe стоит один bisect и пару сложений.
+    """
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._values: dict[LabelsKey, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels_key(labels)
+        try:
+            counts, totals = self._values[key]
+        except KeyError:
+            counts, totals = self._values[key] = [[0] * (len(self.buckets) + 1), [0.0, 0, 0.0]]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+        totals[2] = max(totals[2], value)
+
+    @contextlib.contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[tuple[str, LabelsKey, float]]:
+        for key, (counts, (total, count, _)) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket', key + (('le', le), ), cumulative
+            yield f'{self.name}_sum', key, total
+            yield f'{self.name}_count', key, count
+
+    def summary(self) -> dict:
+        return {
+            _label_suffix(key): dict(count=count, sum=total, avg=total / count if count else 0.0, max=maximum)
+            for key, (_, (total, count, maximum)) in self._values.items()
+        }
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса. Выгружаются в текстовом формате Prometheus (для textfile collector
+    node_exporter) или JSON сводкой в конце запуска.
+    """
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Gauge | Histogram] = {}
+
+    def _get_or_create(self, cls: type, name: str, documentation: str, **kwargs):
+        try:
+            return self._metrics[name]
+        except KeyError:
+            metric = self._metrics[name] = cls(name, documentation, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._get_or_create(Counter, name, documentation)
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation)
+
+    def histogram(self, name: str, documentation: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, buckets=buckets)
+
+    def counter_values(self) -> CounterValues:
+        return {
+            (metric.name, metric.documentation, key): value
+            for metric in self._metrics.values() if metric.type == 'counter'
+            for _, key, value in metric.samples()
+        }
+
+    def merge_counters(self, values: Mapping[tuple[str, str, LabelsKey], float]) -> None:
+        """
+        Прибавляет к счетчикам этого процесса приросты счетчиков из другого процесса.
+        """
+        for (name, documentation, key), value in values.items():
+            self.counter(name, documentation).inc(value, **dict(key))
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, key, value in metric.samples():
+                lines.append(f'{name}{_render_labels(key)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> dict:
+        return {name: metric.summary() for name, metric in self._metrics.items() if metric.summary()}
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Пишет через временный файл и rename, чтобы node_exporter не прочитал файл наполовину.
+        """
+        self._write_atomic(path, self.to_prometheus())
+
+    def write_json(self, path: str) -> None:
+        self._write_atomic(path, json.dumps(self.summary(), indent=2, ensure_ascii=False))
+
+    @staticmethod
+    def _write_atomic(path: str, content: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False, suffix='.tmp') as tmp:
+            tmp.write(content)
+        os.replace(tmp.name, path)
+
+
+metrics: MetricsRegistry
+ModuleSingletonAssigner(MetricsRegistry, 'metrics').assign()
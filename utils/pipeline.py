@@ -0,0 +1,219 @@
+import contextlib
+import dataclasses
+import datetime
+import itertools
+from typing import Any, Awaitable, Callable, Generic, TypeVar
+
+import anyio
+from anyio.abc import TaskGroup
+from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
+
+from utils.logging import log
+from utils.metrics import metrics
+
+__all__ = (
+    'AutoscalePolicy',
+    'PipelineStage',
+)
+
+T = TypeVar('T')
+
+# Коэффициент сглаживания задержки обработчика.
+LATENCY_EWMA_ALPHA = 0.2
+
+STAGE_SECONDS = metrics.histogram('pipeline_stage_seconds', 'Время обработки одного элемента стадией.')
+STAGE_ITEMS = metrics.counter('pipeline_stage_items_total', 'Сколько элементов обработала стадия.')
+QUEUE_WAIT_SECONDS = metrics.histogram('pipeline_queue_wait_seconds', 'Сколько воркер ждал работу из канала.')
+QUEUE_DEPTH = metrics.histogram(
+    'pipeline_queue_depth',
+    'Глубина входного канала стадии в момент получения элемента.',
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class AutoscalePolicy:
+    min_workers: int
+    max_workers: int
+    interval: datetime.timedelta
+    # Можно ли добавить воркера, например пока лимитер запросов к api не исчерпан.
+    can_grow: Callable[[], bool] | None = None
+    # Во сколько раз задержка должна вырасти относительно лучшей, чтобы убрать воркера.
+    latency_ratio: float = 3.0
+
+
+class PipelineStage(Generic[T]):
+    """
+    Стадия пайплайна: входной канал емкостью capacity и workers воркеров, которые его читают.
+    1) Каждый воркер держит свой клон входного канала и клоны входов следующих стадий.
+    2) Стадия завершается закрытием: когда закрыты все клоны отправителей ее входа, воркеры
+    дочитывают остаток и выходят, закрывая свои клоны выходов - так завершение каскадом
+    доходит до последней стадии без опросов по таймеру.
+    3) Если задан batch_size, обработчик получает список: первый элемент плюс то, что успело прийти
+    за batch_timeout (при нулевом таймауте - только то, что уже лежит в канале), но не больше batch_size.
+    4) Если задан autoscale, раз в interval число воркеров подстраивается: +1, если в канале есть
+    работа, все воркеры заняты и policy.can_grow() разрешает; -1, если канал пуст и есть простаивающие
+    воркеры или если задержка обработчика выросла в latency_ratio раз относительно лучшей.
+    """
+    def __init__(
+            self,
+            name: str,
+            workers: int,
+            capacity: int,
+            batch_size: int | None = None,
+            batch_timeout: datetime.timedelta = datetime.timedelta(0),
+            autoscale: AutoscalePolicy | None = None,
+    ) -> None:
+        self.name = name
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.autoscale = autoscale
+        self._send, self._receive = anyio.create_memory_object_stream[T](capacity)
+        self._ids = itertools.count()
+        self._active = 0
+        self._busy = 0
+        self._retiring = 0
+        self._latency: float | None = None
+        self._best_latency: float | None = None
+        self._drained: anyio.Event | None = None
+
+    def sender(self) -> MemoryObjectSendStream[T]:
+        return self._send.clone()
+
+    def start(
+            self,
+            tg: TaskGroup,
+            handler: Callable[..., Awaitable[Any]],
+            *outputs: 'PipelineStage',
+    ) -> None:
+        """
+        Запускает воркеров, каждый вызывает handler(item_or_batch, *senders_of_outputs).
+        """
+        # Собственные клоны выходов нужны, чтобы autoscale мог запускать новых воркеров после close() выходов.
+        output_templates = [output.sender() for output in outputs]
+        for _ in range(self.workers):
+            self._spawn(tg, handler, output_templates)
+        if self.autoscale is None:
+            self._release(output_templates)
+        else:
+            self._drained = anyio.Event()
+            tg.start_soon(self._autoscale, tg, handler, output_templates)
+
+    def close(self) -> None:
+        """
+        Закрывает исходный отправитель. Вызывается, когда всем производителям уже выданы клоны.
+        """
+        self._send.close()
+
+    def _release(self, output_templates: list[MemoryObjectSendStream]) -> None:
+        self._receive.close()
+        for template in output_templates:
+            template.close()
+
+    def _spawn(
+            self,
+            tg: TaskGroup,
+            handler: Callable[..., Awaitable[Any]],
+            output_templates: list[MemoryObjectSendStream],
+    ) -> None:
+        self._active += 1
+        tg.start_soon(
+            self._worker,
+            next(self._ids),
+            handler,
+            self._receive.clone(),
+            [template.clone() for template in output_templates],
+        )
+
+    async def _autoscale(
+            self,
+            tg: TaskGroup,
+            handler: Callable[..., Awaitable[Any]],
+            output_templates: list[MemoryObjectSendStream],
+    ) -> None:
+        policy = self.autoscale
+        try:
+            while True:
+                with anyio.move_on_after(policy.interval.total_seconds()):
+                    await self._drained.wait()
+                if not self._active:
+                    break
+                workers = self._active - self._retiring
+                queued = self._receive.statistics().current_buffer_used
+                slow = (
+                    self._latency is not None
+                    and self._latency > self._best_latency * policy.latency_ratio
+                )
+                if (queued and self._busy >= workers and workers < policy.max_workers and not slow
+                        and (policy.can_grow is None or policy.can_grow())):
+                    self._spawn(tg, handler, output_templates)
+                    await log.ainfo('Autoscale: adding worker.', name=self.name, workers=workers + 1)
+                elif workers > policy.min_workers and ((not queued and self._busy < workers) or slow):
+                    self._retiring += 1
+                    # После сброса лучшая задержка набирается заново уже при меньшем числе воркеров.
+                    self._best_latency = self._latency
+                    await log.ainfo('Autoscale: removing worker.', name=self.name, workers=workers - 1)
+        finally:
+            self._release(output_templates)
+
+    def _observe_latency(self, latency: float) -> None:
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency += LATENCY_EWMA_ALPHA * (latency - self._latency)
+        if self._best_latency is None or self._latency < self._best_latency:
+            self._best_latency = self._latency
+
+    async def _collect(self, first: T, receive: MemoryObjectReceiveStream[T]) -> list[T]:
+        batch = [first]
+        deadline = anyio.current_time() + self.batch_timeout.total_seconds()
+        with contextlib.suppress(anyio.EndOfStream):
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(receive.receive_nowait())
+                except anyio.WouldBlock:
+                    with anyio.move_on_after(deadline - anyio.current_time()) as scope:
+                        batch.append(await receive.receive())
+                    if scope.cancelled_caught:
+                        break
+        return batch
+
+    async def _worker(
+            self,
+            _id: int,
+            handler: Callable[..., Awaitable[Any]],
+            receive: MemoryObjectReceiveStream[T],
+            sends: list[MemoryObjectSendStream],
+    ) -> None:
+        local_log = log.bind(id=_id, name=self.name)
+        try:
+            async with contextlib.AsyncExitStack() as stack:
+                stack.enter_context(receive)
+                for send in sends:
+                    stack.enter_context(send)
+                waiting_since = anyio.current_time()
+                async for item in receive:
+                    QUEUE_DEPTH.observe(receive.statistics().current_buffer_used, stage=self.name)
+                    if self.batch_size is not None:
+                        item = await self._collect(item, receive)
+                    started = anyio.current_time()
+                    QUEUE_WAIT_SECONDS.observe(started - waiting_since, stage=self.name)
+                    await local_log.adebug(f'Got {len(item)} items.' if isinstance(item, list) else f'Got {item}')
+                    self._busy += 1
+                    try:
+                        await handler(item, *sends)
+                    finally:
+                        self._busy -= 1
+                    waiting_since = anyio.current_time()
+                    STAGE_SECONDS.observe(waiting_since - started, stage=self.name)
+                    STAGE_ITEMS.inc(len(item) if isinstance(item, list) else 1, stage=self.name)
+                    self._observe_latency(waiting_since - started)
+                    if self._retiring:
+                        self._retiring -= 1
+                        break
+        finally:
+            self._active -= 1
+            if not self._active and self._drained is not None:
+                self._drained.set()
+        await local_log.ainfo('Exiting, all done.')
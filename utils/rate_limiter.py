@@ -0,0 +1,130 @@
+import asyncio
+import datetime
+import email.utils
+import random
+import time
+from typing import Mapping
+
+__all__ = (
+    'AdaptiveRateLimiter',
+)
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket, общий для всех конкурентных запросов к одному api.
+    1) Скорость (запросов в секунду) растет на step после каждого успешного ответа, но не выше max_rate.
+    2) На 429 скорость падает вдвое (не ниже min_rate), а все запросы ставятся на паузу на Retry-After
+    или на экспоненциальный backoff с jitter, если заголовка нет.
+    3) Заголовки X-RateLimit-Remaining / X-RateLimit-Reset, если api их отдает, задают скорость напрямую.
+    """
+    def __init__(
+            self,
+            rate: float,
+            burst: int,
+            min_rate: float,
+            max_rate: float,
+            step: float,
+            backoff_base: datetime.timedelta,
+            backoff_max: datetime.timedelta,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.step = step
+        self.backoff_base = backoff_base.total_seconds()
+        self.backoff_max = backoff_max.total_seconds()
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def saturated(self) -> bool:
+        """
+        True, если сейчас свободного токена нет и новый запрос будет ждать лимитер.
+        """
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return True
+        return min(self.burst, self._tokens + (now - self._updated_at) * self.rate) < 1
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self) -> None:
+        # Под локом ждущие получают токены по очереди.
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def scale(self, factor: float) -> None:
+        """
+        Умножает скорости лимитера на factor. Процесс, который делит квоту api с другими, берет свою долю.
+        """
+        self.rate *= factor
+        self.min_rate *= factor
+        self.max_rate *= factor
+        self.step *= factor
+
+    def on_success(self, headers: Mapping[str, str]) -> None:
+        self.rate = min(self.max_rate, self.rate + self.step)
+        self._apply_limit_headers(headers)
+
+    def on_rate_limited(self, headers: Mapping[str, str], attempt: int) -> float:
+        """
+        Возвращает паузу в секундах, на которую заблокированы все запросы.
+        """
+        self.rate = max(self.min_rate, self.rate / 2)
+        backoff = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        delay = max(self._retry_after(headers) or 0.0, random.uniform(backoff / 2, backoff))
+        self._block(delay)
+        self._apply_limit_headers(headers)
+        return delay
+
+    def _block(self, delay: float) -> None:
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + delay)
+        self._tokens = 0.0
+        self._updated_at = now
+
+    @staticmethod
+    def _retry_after(headers: Mapping[str, str]) -> float | None:
+        value = headers.get('retry-after')
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+    def _apply_limit_headers(self, headers: Mapping[str, str]) -> None:
+        try:
+            remaining = int(headers['x-ratelimit-remaining'])
+            reset = float(headers['x-ratelimit-reset'])
+        except (KeyError, ValueError):
+            return
+        # Reset бывает как числом секунд до сброса, так и unix временем сброса.
+        if reset > time.time() / 2:
+            reset -= time.time()
+        if reset <= 0:
+            return
+        if remaining <= 0:
+            self._block(reset)
+        else:
+            self.rate = min(self.max_rate, max(self.min_rate, remaining / reset))
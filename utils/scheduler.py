@@ -0,0 +1,76 @@
+import datetime
+import math
+from typing import Awaitable, Callable
+
+import anyio
+
+from utils.logging import log
+
+__all__ = (
+    'PeriodicScheduler',
+)
+
+
+class PeriodicScheduler:
+    """
+    Запускает job раз в interval.
+    1) Время запусков считается от момента старта (started + tick * interval), а не от конца
+    предыдущего запуска, поэтому длительность job и задержки event loop не накапливают дрейф.
+    2) Если предыдущий запуск еще идет, тик пропускается - запуски не накладываются.
+    3) После stop() новые запуски не начинаются, текущему дается grace на завершение, потом он отменяется.
+    """
+    def __init__(
+            self,
+            job: Callable[[], Awaitable[None]],
+            interval: datetime.timedelta,
+            grace: datetime.timedelta,
+    ) -> None:
+        self.job = job
+        self.interval = interval
+        self.grace = grace
+        self._stop: anyio.Event | None = None
+        self._stop_requested = False
+        self._job_done: anyio.Event | None = None
+        # Несколько планировщиков в одном процессе различаем в логах по имени job.
+        self._log = log.bind(job=getattr(job, '__qualname__', repr(job)))
+
+    def stop(self) -> None:
+        # stop() может прийти раньше, чем run() создал событие.
+        self._stop_requested = True
+        if self._stop is not None:
+            self._stop.set()
+
+    async def _run_job(self, tick: int) -> None:
+        self._job_done = job_done = anyio.Event()
+        started = anyio.current_time()
+        try:
+            await self.job()
+        except Exception:
+            await self._log.aexception('Scheduled run failed.', tick=tick)
+        finally:
+            job_done.set()
+            await self._log.ainfo('Scheduled run finished.', tick=tick, duration=anyio.current_time() - started)
+
+    async def run(self) -> None:
+        self._stop = anyio.Event()
+        if self._stop_requested:
+            self._stop.set()
+        interval = self.interval.total_seconds()
+        started = anyio.current_time()
+        tick = 0
+        async with anyio.create_task_group() as tg:
+            while not self._stop.is_set():
+                if self._job_done is not None and not self._job_done.is_set():
+                    await self._log.awarning('Previous run is still in progress, skipping tick.', tick=tick)
+                else:
+                    tg.start_soon(self._run_job, tick)
+                # Если проспали несколько тиков, пропускаем их, а не запускаем пачкой.
+                tick = max(tick + 1, math.floor((anyio.current_time() - started) / interval) + 1)
+                with anyio.move_on_after(started + tick * interval - anyio.current_time()):
+                    await self._stop.wait()
+
+            if self._job_done is not None and not self._job_done.is_set():
+                await self._log.ainfo('Waiting for the current run to finish.', grace=self.grace.total_seconds())
+                with anyio.move_on_after(self.grace.total_seconds()):
+                    await self._job_done.wait()
+            tg.cancel_scope.cancel()
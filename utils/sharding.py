@@ -0,0 +1,41 @@
+import hashlib
+import math
+import zlib
+from typing import Iterable, NamedTuple
+
+__all__ = (
+    'Shard',
+    'shard_of',
+    'stable_chunks',
+)
+
+
+def shard_of(key: str, count: int) -> int:
+    """
+    Стабильный между процессами и запусками номер шарда ключа (hash() строк рандомизирован).
+    Та же функция зарегистрирована в SQLite как crc32, см. database.alchemy.
+    """
+    return zlib.crc32(key.encode()) % count
+
+
+class Shard(NamedTuple):
+    index: int
+    count: int
+
+    def owns(self, key: str) -> bool:
+        return shard_of(key, self.count) == self.index
+
+
+def stable_chunks(keys: Iterable[str], size: int, fill: float = 1.0) -> list[list[str]]:
+    """
+    Раскладывает ключи по ceil(len / (size * fill)) пачкам по хэшу ключа: пока число пачек то же,
+    ключ попадает в ту же пачку, а новый или удаленный ключ меняет только свою пачку.
+    Хэш другой, чем у shard_of: иначе внутри одного шарда ключи ложились бы в часть пачек.
+    """
+    keys = sorted(keys)
+    count = max(1, math.ceil(len(keys) / (size * fill)))
+    chunks = [[] for _ in range(count)]
+    for key in keys:
+        digest = hashlib.blake2b(key.encode(), digest_size=4).digest()
+        chunks[int.from_bytes(digest) % count].append(key)
+    return [chunk for chunk in chunks if chunk]
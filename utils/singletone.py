@@ -1,9 +1,11 @@
+import abc
 import asyncio
 import importlib
 import inspect
 import weakref
 from functools import cache
-from typing import Any, Generic, Type, TypeVar, no_type_check
+from types import ModuleType
+from typing import Any, Callable, Generic, Type, TypeVar, no_type_check
 
 from utils.weakref import Finalizable
 
@@ -13,8 +15,47 @@ __all__ = (
 
 T = TypeVar('T')
 
-class ModuleSingletonAssigner(Generic[T]):
-    def __init__(self, obj: Type[T], attr_name: str) -> None:
+# _resolve не знает такого имени.
+_MISSING = object()
+
+
+@no_type_check
+def _caller_module(depth: int = 2) -> ModuleType:
+    frame = inspect.currentframe()
+    for _ in range(depth):
+        frame = frame.f_back
+    return importlib.import_module(inspect.getmodule(frame).__name__)
+
+
+class _ModuleGetattr(abc.ABC):
+    """
+    Module level __getattr__ (PEP 562). Если у модуля уже есть __getattr__, неизвестные имена
+    передаются ему, поэтому в одном модуле можно назначить несколько ленивых атрибутов.
+    """
+    _module_name: str
+    _fallback: Callable[[str], Any] | None = None
+
+    @abc.abstractmethod
+    def _resolve(self, name: str) -> Any:
+        """
+        Значение атрибута name или _MISSING, если это имя не наше.
+        """
+
+    def _module_level_getattr(self, name: str) -> Any:
+        if (value := self._resolve(name)) is not _MISSING:
+            return value
+        if self._fallback is not None:
+            return self._fallback(name)
+        raise AttributeError(f'module {self._module_name!r} has no attribute {name!r}')
+
+    def _install(self, module: ModuleType) -> None:
+        self._module_name = module.__name__
+        self._fallback = getattr(module, '__getattr__', None)
+        module.__getattr__ = self._module_level_getattr
+
+
+class ModuleSingletonAssigner(_ModuleGetattr, Generic[T]):
+    def __init__(self, obj: Type[T] | Callable[[], T], attr_name: str) -> None:
         self.obj = obj
         self.attr_name = attr_name
 
@@ -22,22 +63,11 @@ class ModuleSingletonAssigner(Generic[T]):
     def _build_obj(self) -> T:
         built_obj = self.obj()
         if isinstance(built_obj, Finalizable):
-            weakref.finalize(built_obj, lambda: asyncio.run(built_obj._finalize()))
+            weakref.finalize(built_obj, lambda: asyncio.run(built_obj.finalize()))
         return built_obj
 
-    def _module_level_getattr(self, name: str) -> T | Any:
-        if name == self.attr_name:
-            return self._build_obj()
-        elif name in __all__:
-            import importlib
-            return importlib.import_module('.' + name, __name__) # ty: ignore[invalid-argument-type]
-        else:
-            raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    def _resolve(self, name: str) -> T | Any:
+        return self._build_obj() if name == self.attr_name else _MISSING
 
-    @no_type_check
     def assign(self) -> None:
-        caller_frame = inspect.currentframe().f_back
-        caller_module = inspect.getmodule(caller_frame)
-        caller_name = caller_module.__name__
-        mod = importlib.import_module(caller_name)
-        mod.__getattr__ = self._module_level_getattr
+        self._install(_caller_module())
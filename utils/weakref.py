@@ -9,4 +9,14 @@ class Finalizable(abc.ABC):
 
     @abc.abstractmethod
     async def _finalize(self) -> None:
-        pass
\ No newline at end of file
+        pass
+
+    async def finalize(self) -> None:
+        """
+        _finalize не больше одного раза: после явного закрытия (daemon по SIGTERM, композитный источник)
+        финализатор синглтона при выходе процесса не закрывает те же ресурсы второй раз.
+        """
+        if getattr(self, '_finalized', False):
+            return
+        self._finalized = True
+        await self._finalize()
\ No newline at end of file